@@ -0,0 +1,182 @@
+"""Аутентификация по JWT без обращения к базе данных.
+
+Включается настройкой JWT_AUTH рядом с токенами djoser. Access-токен
+живет недолго и содержит id и роль пользователя, поэтому пользователь
+запроса собирается из токена, а проверки прав, в том числе IsAdmin,
+обходятся без запроса к базе. Остальные поля пользователя подгружаются
+при первом обращении. Отозванные токены хранятся в кэше Django,
+поэтому он должен быть общим для всех процессов (см. check_settings).
+"""
+from time import time, time_ns
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import is_shared
+
+User = get_user_model()
+
+# Поля пользователя, которые переносятся в токен и по которым
+# проверяются права доступа.
+TOKEN_CLAIMS = ('role', 'is_superuser')
+# Версия токенов пользователя на момент выдачи токена.
+VERSION_CLAIM = 'ver'
+
+
+def check_settings():
+    """Не дает запустить JWT с кэшем, который не общий для процессов:
+    выход и смена пароля отзывали бы токены только в одном процессе
+    и забывались бы при его перезапуске."""
+    if settings.JWT_AUTH and not is_shared():
+        raise ImproperlyConfigured(
+            'JWT_AUTH требует общего кэша (CACHE_BACKEND), например '
+            'Redis или Memcached: в нем хранятся отозванные токены')
+
+
+class TokenDenylist:
+    """Список отозванных токенов в кэше.
+
+    Хранятся только jti отдельных токенов до истечения их срока и
+    версия токенов пользователя на срок жизни refresh-токена. Отзыв всех
+    токенов пользователя меняет версию, и действуют только токены,
+    выданные с новой версией. Записи исчезают сами, когда отозванные
+    токены все равно перестали бы действовать, а проверка токена - одно
+    обращение к кэшу.
+    """
+
+    prefix = 'jwt:denylist'
+
+    def token_key(self, jti):
+        return f'{self.prefix}:token:{jti}'
+
+    def user_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+
+    def revoke(self, token):
+        timeout = int(token['exp'] - time()) + 1
+        if timeout > 0:
+            cache.set(self.token_key(token[jwt_settings.JTI_CLAIM]),
+                      True, timeout)
+
+    def revoke_user(self, user_id):
+        """Отзывает все выданные пользователю токены."""
+        cache.set(self.user_key(user_id), time_ns(), int(
+            jwt_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1)
+
+    def user_version(self, user_id):
+        """Текущая версия токенов пользователя; None, пока их не
+        отзывали."""
+        return cache.get(self.user_key(user_id))
+
+    def is_revoked(self, token):
+        token_key = self.token_key(token.get(jwt_settings.JTI_CLAIM))
+        user_key = self.user_key(token.get(jwt_settings.USER_ID_CLAIM))
+        revoked = cache.get_many([token_key, user_key])
+        if token_key in revoked:
+            return True
+        version = revoked.get(user_key)
+        return version is not None and token.get(VERSION_CLAIM) != version
+
+
+token_denylist = TokenDenylist()
+
+
+def token_user(token):
+    """Пользователь из claims токена без запроса к базе.
+
+    Не попавшие в токен поля отложены, как у only(), и читаются из
+    базы при обращении к ним.
+    """
+    try:
+        loaded = {'id': token[jwt_settings.USER_ID_CLAIM]}
+        loaded.update((claim, token[claim]) for claim in TOKEN_CLAIMS)
+    except KeyError:
+        raise InvalidToken('Токен не содержит данных пользователя')
+    names = [field.attname for field in User._meta.concrete_fields
+             if field.attname in loaded]
+    return User.from_db(
+        DEFAULT_DB_ALIAS, names, [loaded[name] for name in names])
+
+
+def load_user(user):
+    """Загружает одним запросом отложенные поля пользователя из токена."""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """Аутентификация по access-токену с заголовком Bearer.
+
+    В отличие от JWTAuthentication не читает пользователя из базы.
+    Блокировка пользователя, смена пароля или роли отзывают его токены.
+    При JWT_AUTH = False заголовок Bearer не проверяется.
+    """
+
+    def authenticate(self, request):
+        if not settings.JWT_AUTH:
+            return None
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if token_denylist.is_revoked(token):
+            raise InvalidToken('Токен отозван')
+        return token
+
+    def get_user(self, validated_token):
+        return token_user(validated_token)
+
+
+class TokenObtainSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Выдает пару токенов по email и паролю, добавляя в них роль."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in TOKEN_CLAIMS:
+            token[claim] = getattr(user, claim)
+        version = token_denylist.user_version(user.pk)
+        if version is not None:
+            token[VERSION_CLAIM] = version
+        return token
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Обновляет access-токен, если refresh-токен не отозван."""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if token_denylist.is_revoked(refresh):
+            raise InvalidToken('Токен отозван')
+        data = super().validate(attrs)
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            token_denylist.revoke(refresh)
+        return data
+
+
+class TokenLogoutSerializer(serializers.Serializer):
+    """Refresh-токен пользователя, который нужно отозвать при выходе."""
+
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as error:
+            raise serializers.ValidationError(error.args[0])
+        user = self.context['request'].user
+        if refresh.get(jwt_settings.USER_ID_CLAIM) != user.pk:
+            raise serializers.ValidationError(
+                'Токен выдан другому пользователю')
+        return refresh
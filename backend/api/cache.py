@@ -0,0 +1,178 @@
+from hashlib import md5
+from time import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .metrics import CACHE_HITS, CACHE_MISSES, cache_stats
+from .profiling import measure
+from .renderers import FastJSONRenderer
+from .replicas import read_from_primary
+
+# Кэши, которые видит только один процесс и которые теряются при его
+# перезапуске.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared():
+    """Общий ли кэш по умолчанию для всех процессов."""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+class CatalogCache:
+    """Версионированный кэш ответов для редко меняющегося справочника.
+
+    Версия справочника - время последнего изменения в целых секундах -
+    хранится в кэше Django и меняется при сохранении или удалении
+    объектов. Из нее же строятся ETag и Last-Modified. Ответы хранятся
+    уже отрендеренными в json, поэтому попадание в кэш обходится без
+    сериализации, а клиент с актуальным ETag или If-Modified-Since
+    получает 304. Изменение видят все процессы, только если кэш общий
+    (см. is_shared и проверку api.W001).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'catalog:{name}:version'
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, int(time()), None)
+            version = cache.get(self.version_key) or time()
+        return int(version)
+
+    def bump(self):
+        # Несколько изменений в одну секунду все равно дают разные
+        # версии, иначе If-Modified-Since вернул бы 304 на старый ответ.
+        current = cache.get(self.version_key) or 0
+        cache.set(self.version_key,
+                  max(int(time()), int(current) + 1), None)
+
+    def get(self, name, build):
+        """Возвращает значение из кэша текущей версии справочника или
+        вычисляет его функцией build."""
+        key = f'catalog:{self.name}:{self.version()}:{name}'
+        value = cache.get(key)
+        if value is None:
+            with read_from_primary():
+                value = build()
+            cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+        return value
+
+    def response(self, request, build):
+        """Возвращает ответ из кэша или строит его функцией build."""
+        if request.accepted_renderer.format != 'json':
+            return build()
+        version = self.version()
+        path = '?'.join((request.path, urlencode(
+            sorted(request.query_params.lists()), doseq=True)))
+        etag = quote_etag(
+            md5(f'{self.name}:{version}:{path}'.encode()).hexdigest())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=version)
+        if response is not None:
+            self.count('hits')
+        else:
+            key = f'catalog:{self.name}:{version}:{path}'
+            body = cache.get(key)
+            self.count('misses' if body is None else 'hits')
+            if body is None:
+                with read_from_primary():
+                    built = build()
+                if built.status_code != 200:
+                    return built
+                with measure('render'):
+                    body = FastJSONRenderer().render(built.data)
+                cache.set(key, body, settings.CATALOG_CACHE_TIMEOUT)
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def count(self, name):
+        # Счетчики Prometheus в памяти или mmap-файле процесса: без
+        # обращений к кэшу, а суммы по процессам считает cache_stats.
+        counter = CACHE_HITS if name == 'hits' else CACHE_MISSES
+        counter.labels(self.name).inc()
+
+    def stats(self):
+        return cache_stats(self.name)
+
+
+class RecipeListCache(CatalogCache):
+    """Кэш страниц списка рецептов для анонимных пользователей.
+
+    Ключ строится из нормализованных параметров tags, author, page и
+    limit. Общая версия меняется, когда меняется состав страниц:
+    создание или удаление рецепта, смена его тегов, правка тегов и
+    ингредиентов справочника. Правка отдельного рецепта меняет только
+    его собственную версию, и сбрасываются лишь страницы, на которых
+    он был.
+    """
+
+    params = ('tags', 'author', 'page', 'limit')
+
+    def recipe_key(self, pk):
+        return f'catalog:{self.name}:recipe:{pk}'
+
+    def bump_recipe(self, pk):
+        cache.set(self.recipe_key(pk), time(), None)
+
+    def page_key(self, request):
+        params = request.query_params
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'
+                or not set(params).issubset(self.params)):
+            return None
+        normalized = [('tags', sorted(set(params.getlist('tags'))))]
+        normalized += [(name, params[name]) for name in self.params[1:]
+                       if name in params]
+        return 'catalog:{}:{}:{}:{}'.format(
+            self.name, self.version(), request.get_host(),
+            urlencode(normalized, doseq=True))
+
+    def recipe_versions(self, pks):
+        versions = cache.get_many([self.recipe_key(pk) for pk in pks])
+        return {pk: versions.get(self.recipe_key(pk), 0) for pk in pks}
+
+    def response(self, request, build):
+        key = self.page_key(request)
+        if key is None:
+            return build()
+        entry = cache.get(key)
+        if entry is not None:
+            body, versions = entry
+            if self.recipe_versions(versions) == versions:
+                self.count('hits')
+                return HttpResponse(body, content_type='application/json')
+        self.count('misses')
+        started = time()
+        with read_from_primary():
+            response = build()
+        if response.status_code != 200:
+            return response
+        versions = self.recipe_versions(
+            [recipe['id'] for recipe in response.data['results']])
+        with measure('render'):
+            body = FastJSONRenderer().render(response.data)
+        # Рецепт, измененный во время построения страницы, мог попасть
+        # в нее в старом виде, поэтому такая страница не кэшируется.
+        if all(version < started for version in versions.values()):
+            cache.set(key, (body, versions),
+                      settings.RECIPE_LIST_CACHE_TIMEOUT)
+        return HttpResponse(body, content_type='application/json')
+
+
+tags_cache = CatalogCache('tags')
+ingredients_cache = CatalogCache('ingredients')
+recipe_list_cache = RecipeListCache('recipes')
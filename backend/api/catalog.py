@@ -0,0 +1,110 @@
+import threading
+from time import monotonic
+
+from django.conf import settings
+
+from recipes.models import Ingredient, Tag
+from .cache import ingredients_cache, tags_cache
+from .replicas import read_from_primary
+
+
+class Catalog:
+    """Справочник модели в памяти процесса: id -> несохраненный объект.
+
+    Версия справочника в кэше Django, которую сигналы меняют при каждом
+    изменении, сверяется не чаще раза в check_interval секунд, поэтому
+    при общем кэше все процессы gunicorn перечитывают справочник вскоре
+    после правки в любом из них, а процесс, в котором была правка, -
+    сразу. С локальным кэшем справочник перечитывается не реже раза
+    в ttl секунд. Отсутствующие id перепроверяются в базе точечным
+    запросом, без перечитывания всего справочника.
+    """
+
+    def __init__(self, model, fields, catalog_cache, ttl, check_interval):
+        self.model = model
+        self.fields = fields
+        self.catalog_cache = catalog_cache
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._objects = None
+        self._version = None
+        self._built_at = 0
+        self._checked_at = 0
+
+    def invalidate(self):
+        """Сбрасывает справочник после изменения в этом процессе."""
+        self._objects = None
+
+    def _stale(self):
+        now = monotonic()
+        if self._objects is None or now - self._built_at > self.ttl:
+            return True
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return self.catalog_cache.version() != self._version
+
+    def objects(self, refresh=False):
+        objects = self._objects
+        if refresh or objects is None or self._stale():
+            with self._lock, read_from_primary():
+                version = self.catalog_cache.version()
+                objects = {
+                    values['id']: self.model(**values)
+                    for values in self.model.objects.values('id', *self.fields)
+                }
+                self._objects = objects
+                self._version = version
+                self._built_at = self._checked_at = monotonic()
+        return objects
+
+    def _fetch(self, ids):
+        """Дочитывает из базы объекты с id из ids, которых еще нет
+        в справочнике, например созданные без сигналов."""
+        objects = self.objects()
+        with read_from_primary():
+            for values in self.model.objects.filter(id__in=ids).values(
+                    'id', *self.fields):
+                objects[values['id']] = self.model(**values)
+        return objects
+
+    def get(self, pk):
+        """Возвращает объект по id или None, если его нет и в базе."""
+        obj = self.objects().get(pk)
+        if obj is None:
+            obj = self._fetch([pk]).get(pk)
+        return obj
+
+    def missing(self, ids):
+        """Возвращает те из ids, которых нет в справочнике."""
+        def lookup(objects):
+            found = []
+            for value in ids:
+                try:
+                    found.append(int(value) in objects)
+                except (TypeError, ValueError):
+                    found.append(False)
+            return [value for value, ok in zip(ids, found) if not ok]
+
+        missing = lookup(self.objects())
+        numeric = []
+        for value in missing:
+            try:
+                numeric.append(int(value))
+            except (TypeError, ValueError):
+                pass
+        # Заведомо несуществующие id не проверяются в базе: они не
+        # влезают в bigint.
+        numeric = [value for value in numeric if 0 < value < 2 ** 63]
+        if numeric:
+            missing = lookup(self._fetch(numeric))
+        return missing
+
+
+ingredient_catalog = Catalog(
+    Ingredient, ('name', 'measurement_unit'), ingredients_cache,
+    settings.CATALOG_TTL, settings.CATALOG_VERSION_CHECK_INTERVAL)
+tag_catalog = Catalog(
+    Tag, ('name', 'slug', 'color'), tags_cache, settings.CATALOG_TTL,
+    settings.CATALOG_VERSION_CHECK_INTERVAL)
@@ -0,0 +1,17 @@
+from django.core.checks import Tags, Warning, register
+
+from .cache import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """Кэш в памяти процесса не годится для нескольких воркеров:
+    сброс справочников виден только в одном из них."""
+    if is_shared():
+        return []
+    return [Warning(
+        'Кэш по умолчанию не общий для процессов: после правки тегов и '
+        'ингредиентов другие воркеры до CATALOG_CACHE_TIMEOUT отдают '
+        'старые ответы с разными ETag.',
+        hint='Укажите CACHE_BACKEND и CACHE_LOCATION, например Memcached.',
+        id='api.W001')]
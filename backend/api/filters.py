@@ -1,7 +1,41 @@
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import (Case, Exists, FloatField, OuterRef, Q, Value,
+                              When)
 from django_filters import rest_framework as filters
-from rest_framework import filters as search_filter
+from rest_framework.filters import BaseFilterBackend
+
+from recipes.models import Recipe, Tag
+from .cache import tags_cache
+from .search import ingredient_index
+
+logger = logging.getLogger(__name__)
+
+
+# Установлено ли pg_trgm в базе: проверяется один раз на базу.
+_trigram_available = {}
 
-from recipes.models import Recipe
+
+def trigram_available(alias):
+    """Триграммный поиск включен настройкой и расширение pg_trgm
+    установлено в базе alias: без него similarity() и % дают ошибку
+    SQL, а миграция 0019 пропускает расширение, если его нет на
+    сервере."""
+    if not settings.RECIPE_SEARCH_TRIGRAM:
+        return False
+    if alias not in _trigram_available:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[alias] = cursor.fetchone() is not None
+        if not _trigram_available[alias]:
+            logger.warning('Расширение pg_trgm не установлено в базе %s, '
+                           'поиск рецептов без триграмм', alias)
+    return _trigram_available[alias]
 
 
 def str_filter_to_bool(value):
@@ -12,38 +46,100 @@ def str_filter_to_bool(value):
     return BOOL_FILTER[value]
 
 
-class IngredientFilter(search_filter.SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """Поиск ингредиентов по названию через индекс в памяти."""
+
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or view.detail:
+            return queryset
+        return ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT)
+
+
+def tag_ids_by_slug():
+    """Возвращает словарь слаг - id тегов из кэша справочника."""
+    return tags_cache.get(
+        'ids_by_slug', lambda: dict(Tag.objects.values_list('slug', 'id')))
+
+
+class TagsFilter(filters.MultipleChoiceFilter):
+    """Фильтр рецептов по слагам тегов.
+
+    Варианты берутся из кэша тегов, а рецепты отбираются подзапросом
+    EXISTS, поэтому не нужны ни DISTINCT, ни выборка всех слагов.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', lambda: [
+            (slug, slug) for slug in tag_ids_by_slug()])
+        kwargs.setdefault('distinct', False)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        tag_ids = tag_ids_by_slug()
+        return qs.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value])))
+
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр для рецептов."""
 
     author = filters.CharFilter(field_name='author__id')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagsFilter(field_name='tags__slug')
     is_favorited = filters.CharFilter(
         field_name='is_favorited', method='filter_is_favorited')
     is_in_shopping_cart = filters.CharFilter(
         field_name='is_in_shopping_cart', method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     def filter_is_favorited(self, queryset, name, value):
-        user = getattr(self.request, 'user', None)
-        if user is None or value not in ['0', '1']:
+        if value not in ['0', '1']:
             return queryset
-        if str_filter_to_bool(value):
-            return queryset.filter(favorite_user__user=user)
-        else:
-            return queryset.exclude(favorite_user__user=user)
+        return queryset.filter(is_favorited=str_filter_to_bool(value))
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = getattr(self.request, 'user', None)
-        if user is None or value not in ['0', '1']:
+        if value not in ['0', '1']:
+            return queryset
+        return queryset.filter(
+            is_in_shopping_cart=str_filter_to_bool(value))
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
             return queryset
-        if str_filter_to_bool(value):
-            return queryset.filter(cart_user__user=user)
-        else:
-            return queryset.exclude(cart_user__user=user)
+        if connections[queryset.db].vendor != 'postgresql':
+            return self.filter_search_fallback(queryset, value)
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        rank = SearchRank(
+            SearchVector('name', weight='A', config='russian')
+            + SearchVector('text', weight='B', config='russian'), query)
+        condition = Q(document=query)
+        if trigram_available(queryset.db):
+            rank += TrigramSimilarity('name', value)
+            condition |= Q(name__trigram_similar=value)
+        return queryset.alias(
+            document=SearchVector('name', 'text', config='russian')
+        ).annotate(rank=rank).filter(condition).order_by(
+            '-rank', '-date_create')
+
+    def filter_search_fallback(self, queryset, value):
+        """Поиск по вхождению подстроки для баз без полнотекстового
+        поиска, например SQLite при локальной разработке."""
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+        ).annotate(rank=Case(
+            When(name__icontains=value, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField()
+        )).order_by('-rank', '-date_create')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
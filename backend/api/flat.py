@@ -0,0 +1,102 @@
+"""Быстрое представление рецептов для чтения.
+
+Список и карточка рецепта строятся из строк .values() и справочников в
+памяти процесса, без создания вложенных сериализаторов на каждый
+объект. Результат совпадает с RecipeSerializer побайтно, что проверяет
+tests/test_flat_recipes.py, поэтому при изменении полей сериализатора
+нужно менять и эту функцию.
+"""
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from recipes.models import IngredientAmount, Recipe
+from .catalog import ingredient_catalog, tag_catalog
+from .images import image_variant_urls
+
+RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_variants', 'text', 'cooking_time',
+    'date_create', 'author_id', 'author__email', 'author__username',
+    'author__first_name', 'author__last_name', 'author_is_subscribed',
+    'is_favorited', 'is_in_shopping_cart',
+)
+
+
+def recipe_rows(queryset):
+    """Строки рецептов из queryset RecipeViewSet.get_queryset()."""
+    return queryset.values(*RECIPE_FIELDS)
+
+
+def recipe_instance(row):
+    """Несохраненный Recipe с автором из строки recipe_rows, например
+    для проверки прав на объект без лишних запросов."""
+    author = Recipe._meta.get_field('author').related_model(
+        id=row['author_id'], email=row['author__email'],
+        username=row['author__username'],
+        first_name=row['author__first_name'],
+        last_name=row['author__last_name'])
+    return Recipe(
+        id=row['id'], name=row['name'], image=row['image'],
+        image_variants=row['image_variants'], text=row['text'],
+        cooking_time=row['cooking_time'], date_create=row['date_create'],
+        author=author)
+
+
+def recipe_tags(ids):
+    tags = defaultdict(list)
+    representations = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=ids).order_by('tag_id').values_list(
+                'recipe_id', 'tag_id'):
+        if tag_id not in representations:
+            tag = tag_catalog.get(tag_id)
+            representations[tag_id] = tag and {
+                'id': tag.id, 'name': tag.name, 'slug': tag.slug,
+                'color': tag.color}
+        if representations[tag_id] is not None:
+            tags[recipe_id].append(representations[tag_id])
+    return tags
+
+
+def recipe_ingredients(ids):
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, amount in IngredientAmount.objects.filter(
+            recipe_id__in=ids).order_by('pk').values_list(
+                'recipe_id', 'ingredient_id', 'amount'):
+        ingredient = ingredient_catalog.get(ingredient_id)
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': ingredient and ingredient.name,
+            'measurement_unit': ingredient and ingredient.measurement_unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def represent_recipes(rows):
+    """Представление рецептов в формате RecipeSerializer: два запроса
+    на всю страницу - теги и ингредиенты."""
+    ids = [row['id'] for row in rows]
+    tags = recipe_tags(ids)
+    ingredients = recipe_ingredients(ids)
+    return [{
+        'id': row['id'],
+        'tags': tags[row['id']],
+        'author': {
+            'email': row['author__email'],
+            'id': row['author_id'],
+            'username': row['author__username'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+            'is_subscribed': row['author_is_subscribed'],
+        },
+        'ingredients': ingredients[row['id']],
+        'name': row['name'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'image_variants': image_variant_urls(
+            row['image'], row['image_variants']),
+        'text': row['text'],
+        'cooking_time': row['cooking_time'],
+        'is_favorited': row['is_favorited'],
+        'is_in_shopping_cart': row['is_in_shopping_cart'],
+    } for row in rows]
@@ -0,0 +1,171 @@
+import base64
+import binascii
+import hashlib
+import logging
+import posixpath
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from jobs.queue import enqueue
+from recipes.models import Recipe
+from .cache import recipe_list_cache
+from .metrics import IMAGE_QUEUE
+
+logger = logging.getLogger(__name__)
+
+DECODE_CHUNK_SIZE = 64 * 1024
+VARIANT_FORMATS = (('jpg', 'JPEG'), ('webp', 'WEBP'))
+
+
+def decode_base64_image(data, name):
+    """Декодирует base64 во временный файл частями.
+
+    Размер проверяется до декодирования по длине строки, поэтому
+    слишком большая картинка отклоняется без выделения памяти под нее.
+    """
+    max_size = settings.RECIPE_IMAGE_MAX_SIZE
+    if len(data) // 4 * 3 > max_size + 2:
+        raise serializers.ValidationError(
+            f'Размер картинки превышает {max_size} байт')
+    file = tempfile.TemporaryFile()
+    try:
+        for start in range(0, len(data), DECODE_CHUNK_SIZE):
+            file.write(base64.b64decode(
+                data[start:start + DECODE_CHUNK_SIZE], validate=True))
+    except (binascii.Error, ValueError):
+        file.close()
+        raise serializers.ValidationError('Некорректная картинка')
+    file.seek(0)
+    return File(file, name=name)
+
+
+def variant_name(name, ext):
+    return name if ext == 'jpg' else f'{name}_{ext}'
+
+
+def variant_urls(recipe):
+    """Ссылки на уменьшенные копии картинки рецепта.
+
+    Пока копии не готовы, вместо каждой из них отдается оригинал.
+    """
+    return image_variant_urls(recipe.image.name, recipe.image_variants)
+
+
+def image_variant_urls(image_name, variants):
+    variants = variants or {}
+    original = default_storage.url(image_name) if image_name else None
+    return {
+        variant_name(name, ext): (
+            default_storage.url(variants[variant_name(name, ext)])
+            if variant_name(name, ext) in variants else original)
+        for name in settings.RECIPE_IMAGE_SIZES
+        for ext, _ in VARIANT_FORMATS
+    }
+
+
+def variants_dir(recipe_id, image_name):
+    """Каталог копий картинки: свой для каждого файла картинки, чтобы
+    задача для уже замененной картинки не затерла копии новой."""
+    digest = hashlib.sha1(image_name.encode()).hexdigest()[:16]
+    return f'recipes/images/variants/{recipe_id}/{digest}'
+
+
+def process_recipe_image(recipe_id, image_name):
+    """Создает уменьшенные копии картинки в jpeg и webp и сохраняет
+    их пути в рецепте, если картинка за это время не сменилась."""
+    if not Recipe.objects.filter(pk=recipe_id, image=image_name).exists():
+        return
+    variants = {}
+    with default_storage.open(image_name) as file:
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    directory = variants_dir(recipe_id, image_name)
+    for name, size in settings.RECIPE_IMAGE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((size, size))
+        for ext, image_format in VARIANT_FORMATS:
+            path = posixpath.join(directory, f'{name}.{ext}')
+            # Копия от повторного запуска для той же картинки такая же,
+            # поэтому готовый файл не перезаписывается.
+            if not default_storage.exists(path):
+                buffer = BytesIO()
+                resized.save(buffer, image_format,
+                             quality=settings.RECIPE_IMAGE_QUALITY)
+                path = default_storage.save(
+                    path, ContentFile(buffer.getvalue()))
+            variants[variant_name(name, ext)] = path
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=image_name).update(image_variants=variants)
+    if updated:
+        recipe_list_cache.bump_recipe(recipe_id)
+    else:
+        for path in variants.values():
+            default_storage.delete(path)
+
+
+class ImagePool:
+    """Пул потоков для обработки картинок вне запроса."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, recipe_id, image_name):
+        if not settings.RECIPE_IMAGE_WORKERS:
+            process_recipe_image(recipe_id, image_name)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.RECIPE_IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images')
+            self.pending += 1
+        IMAGE_QUEUE.inc()
+        self._executor.submit(self._run, recipe_id, image_name)
+
+    def _run(self, recipe_id, image_name):
+        try:
+            for attempt in range(1, settings.RECIPE_IMAGE_ATTEMPTS + 1):
+                try:
+                    process_recipe_image(recipe_id, image_name)
+                    break
+                except Exception:
+                    logger.exception(
+                        'Не удалось обработать картинку %s, попытка %d',
+                        image_name, attempt)
+                    if attempt < settings.RECIPE_IMAGE_ATTEMPTS:
+                        time.sleep(settings.RECIPE_IMAGE_RETRY_DELAY
+                                   * 2 ** (attempt - 1))
+        finally:
+            connection.close()
+            with self._lock:
+                self.pending -= 1
+            IMAGE_QUEUE.dec()
+
+
+image_pool = ImagePool()
+
+
+def schedule_image_processing(recipe):
+    """Ставит картинку рецепта в обработку после фиксации транзакции:
+    в пул потоков или, если RECIPE_IMAGE_QUEUE = 'jobs', в очередь
+    фоновых задач."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    if settings.RECIPE_IMAGE_QUEUE == 'jobs':
+        transaction.on_commit(lambda: enqueue('process_recipe_image', {
+            'recipe_id': recipe_id, 'image_name': image_name}))
+    else:
+        transaction.on_commit(
+            lambda: image_pool.submit(recipe_id, image_name))
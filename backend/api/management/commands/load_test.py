@@ -0,0 +1,427 @@
+import base64
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from PIL import Image
+
+from recipes.models import Recipe
+
+SCENARIOS = ('browse', 'browse_user', 'toggle', 'create', 'download')
+DEFAULT_MIX = 'browse=40,browse_user=30,toggle=20,create=5,download=5'
+PASSWORD = 'load-test-password'
+PERCENTILES = (50, 95, 99)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_mix(value):
+    """Разбирает смесь сценариев вида browse=40,toggle=20 в веса."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(
+                f'Неизвестный сценарий {name}, доступны: '
+                f'{", ".join(SCENARIOS)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Некорректный вес сценария {name}')
+    if not any(mix.values()):
+        raise CommandError('Сумма весов сценариев должна быть больше 0')
+    return mix
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def sample_image():
+    """Небольшая картинка рецепта в base64, как ее шлет фронтенд."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (226, 108, 45)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class HttpTransport:
+    """Запросы к запущенному экземпляру по HTTP, сессия на поток."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+
+    def request(self, method, path, token=None, data=None):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        response = session.request(
+            method, self.base_url + path, json=data, headers=headers)
+        return response.status_code, response.content
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Django в этом же процессе.
+
+    Работает с базой из настроек, а не с тестовой.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                     if host != '*'), 'localhost')
+        self.host = host or 'localhost'
+
+    def request(self, method, path, token=None, data=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=self.host)
+        extra = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        if data is not None:
+            extra.update(data=json.dumps(data),
+                         content_type='application/json')
+        response = getattr(client, method.lower())(path, **extra)
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return response.status_code, content
+
+
+class Stats:
+    """Время ответов и статусы по эндпоинтам, общие для потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, status, duration):
+        with self.lock:
+            self.latencies[endpoint].append(duration)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                'requests': len(latencies),
+                'errors': sum(count for status, count in statuses.items()
+                              if status == 'error' or status >= 500),
+                'statuses': {str(status): count
+                             for status, count in sorted(
+                                 statuses.items(), key=str)},
+                'throughput': len(latencies) / elapsed,
+                'mean_ms': sum(latencies) / len(latencies) * 1000,
+                **{f'p{percent}_ms': percentile(latencies, percent) * 1000
+                   for percent in PERCENTILES},
+                'max_ms': latencies[-1] * 1000,
+            }
+        total = sum(item['requests'] for item in endpoints.values())
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'errors': sum(item['errors'] for item in endpoints.values()),
+            'throughput': total / elapsed if elapsed else 0,
+            'endpoints': endpoints,
+        }
+
+
+class LoadTest:
+    """Сценарии нагрузки поверх API и данные, которые им нужны."""
+
+    def __init__(self, transport, stats, users, seed):
+        self.transport = transport
+        self.stats = stats
+        self.users = users
+        self.seed = seed
+        self.run = uuid.uuid4().hex[:8]
+        self.lock = threading.Lock()
+        self.failed = set()
+        self.tokens = []
+        self.tags = []
+        self.ingredients = []
+        self.recipes = []
+        self.image = sample_image()
+
+    def call(self, endpoint, method, path, token=None, data=None):
+        started = time.perf_counter()
+        try:
+            status, content = self.transport.request(
+                method, path, token, data)
+        except Exception:
+            status, content = 'error', b''
+            # Трассировка печатается один раз на эндпоинт, чтобы сбой
+            # транспорта не утопил отчет в одинаковых ошибках.
+            with self.lock:
+                first = endpoint not in self.failed
+                self.failed.add(endpoint)
+            if first:
+                logger.exception('Запрос %s %s завершился ошибкой',
+                                 method, path)
+        self.stats.add(endpoint, status, time.perf_counter() - started)
+        return status, content
+
+    def prepare(self):
+        """Создает пользователей для нагрузки и читает теги,
+        ингредиенты и рецепты, с которыми будут работать сценарии."""
+        for number in range(self.users):
+            email = f'load-{self.run}-{number}@foodgram.test'
+            status, _ = self.transport.request('POST', '/api/users/', data={
+                'email': email, 'username': f'load-{self.run}-{number}',
+                'first_name': 'Нагрузка', 'last_name': 'Тест',
+                'password': PASSWORD})
+            if status != 201:
+                raise CommandError(
+                    f'Не удалось создать пользователя {email}: {status}')
+            status, content = self.transport.request(
+                'POST', '/api/auth/token/login/',
+                data={'email': email, 'password': PASSWORD})
+            if status != 200:
+                raise CommandError(f'Не удалось войти как {email}: {status}')
+            self.tokens.append(json.loads(content)['auth_token'])
+
+        self.tags = self.fetch('/api/tags/')
+        self.ingredients = [
+            ingredient['id'] for ingredient
+            in self.fetch('/api/ingredients/')[:500]]
+        self.recipes = [recipe['id'] for recipe in self.fetch(
+            '/api/recipes/?limit=100')['results']]
+        if not self.tags or not self.ingredients:
+            raise CommandError('Для нагрузки нужны теги и ингредиенты')
+
+    def cleanup(self):
+        """Удаляет пользователей этого запуска, их рецепты и картинки
+        рецептов напрямую в базе из настроек. Возвращает число
+        удаленных пользователей и рецептов."""
+        users = get_user_model().objects.filter(
+            username__startswith=f'load-{self.run}-')
+        recipes = Recipe.objects.filter(author__in=users)
+        files = []
+        for image, variants in recipes.values_list('image', 'image_variants'):
+            files.append(image)
+            files.extend((variants or {}).values())
+        recipe_count = recipes.count()
+        user_count = users.count()
+        # Рецепты, избранное и подписки удаляются каскадом.
+        users.delete()
+        for path in filter(None, files):
+            default_storage.delete(path)
+        return user_count, recipe_count
+
+    def fetch(self, path):
+        status, content = self.transport.request('GET', path)
+        if status != 200:
+            raise CommandError(f'{path} вернул {status}')
+        return json.loads(content)
+
+    def recipe_list_path(self, rand):
+        tags = rand.sample(self.tags, rand.randint(0, min(2, len(self.tags))))
+        query = ''.join(f'&tags={tag["slug"]}' for tag in tags)
+        return f'/api/recipes/?page={rand.randint(1, 3)}{query}'
+
+    def random_recipe(self, rand):
+        with self.lock:
+            return rand.choice(self.recipes) if self.recipes else None
+
+    def browse(self, rand, token=None):
+        suffix = '' if token is None else ' (user)'
+        self.call(f'GET /api/recipes/{suffix}', 'GET',
+                  self.recipe_list_path(rand), token)
+        recipe = self.random_recipe(rand)
+        if recipe is not None:
+            self.call(f'GET /api/recipes/<id>/{suffix}', 'GET',
+                      f'/api/recipes/{recipe}/', token)
+
+    def browse_user(self, rand, token):
+        self.browse(rand, token)
+
+    def toggle(self, rand, token):
+        recipe = self.random_recipe(rand)
+        if recipe is None:
+            return
+        for action in ('favorite', 'shopping_cart'):
+            endpoint = f'/api/recipes/<id>/{action}/'
+            path = f'/api/recipes/{recipe}/{action}/'
+            status, _ = self.call(f'POST {endpoint}', 'POST', path, token)
+            if status == 400 or rand.random() < 0.5:
+                self.call(f'DELETE {endpoint}', 'DELETE', path, token)
+
+    def create(self, rand, token):
+        status, content = self.call(
+            'POST /api/recipes/', 'POST', '/api/recipes/', token, {
+                'name': f'Нагрузочный рецепт {rand.randint(1, 10 ** 6)}',
+                'text': 'Рецепт создан нагрузочным тестом',
+                'cooking_time': rand.randint(1, 120),
+                'image': self.image,
+                'tags': [rand.choice(self.tags)['id']],
+                'ingredients': [
+                    {'id': ingredient, 'amount': rand.randint(1, 500)}
+                    for ingredient in rand.sample(
+                        self.ingredients, min(3, len(self.ingredients)))],
+            })
+        if status == 201:
+            with self.lock:
+                self.recipes.append(json.loads(content)['id'])
+
+    def download(self, rand, token):
+        self.call('GET /api/recipes/download_shopping_cart/', 'GET',
+                  '/api/recipes/download_shopping_cart/', token)
+
+    def worker(self, number, mix, deadline, budget):
+        """Выполняет случайные сценарии из смеси до конца времени или
+        пока не исчерпан общий лимит итераций."""
+        rand = random.Random(self.seed + number)
+        names, weights = zip(*mix.items())
+        while time.monotonic() < deadline and budget.take():
+            name = rand.choices(names, weights)[0]
+            if name == 'browse':
+                self.browse(rand)
+            else:
+                getattr(self, name)(rand, rand.choice(self.tokens))
+
+    def thread_worker(self, *args):
+        try:
+            self.worker(*args)
+        finally:
+            connections.close_all()
+
+
+class Budget:
+    """Общий для потоков лимит итераций; None - без лимита."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.limit is None:
+            return True
+        with self.lock:
+            if self.limit <= 0:
+                return False
+            self.limit -= 1
+            return True
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: смесь сценариев с заданной '
+            'конкурентностью, перцентили времени ответа по эндпоинтам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного экземпляра, например '
+                 'http://localhost:8080; без него запросы идут через '
+                 'тестовый клиент в этом процессе')
+        parser.add_argument(
+            '--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+            help=f'Веса сценариев, по умолчанию {DEFAULT_MIX}')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число одновременных клиентов')
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность теста в секундах')
+        parser.add_argument(
+            '--iterations', type=int,
+            help='Остановиться после этого числа сценариев')
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Сколько пользователей создать для сценариев со входом')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Файл для результатов в json')
+        parser.add_argument(
+            '--cleanup', action='store_true',
+            help='После теста удалить созданных пользователей load-* и '
+                 'их рецепты; удаление идет в базе из настроек, поэтому '
+                 'с --url она должна совпадать с базой экземпляра')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['users'] < 1:
+            raise CommandError('concurrency и users должны быть больше 0')
+        transport = (HttpTransport(options['url']) if options['url']
+                     else ClientTransport())
+        stats = Stats()
+        load = LoadTest(transport, stats, options['users'], options['seed'])
+        target = options['url'] or 'тестовый клиент'
+        try:
+            report = self.run_load(load, stats, target, options)
+        finally:
+            if options['cleanup']:
+                users, recipes = load.cleanup()
+                self.stdout.write(f'Удалено пользователей {users}, '
+                                  f'рецептов {recipes}')
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+    def run_load(self, load, stats, target, options):
+        self.stdout.write(f'Подготовка данных: {target}')
+        load.prepare()
+
+        mix = options['mix']
+        concurrency = options['concurrency']
+        self.stdout.write(
+            f'Нагрузка: {concurrency} клиентов, {options["duration"]} с, '
+            f'смесь {mix}')
+        budget = Budget(options['iterations'])
+        started = time.monotonic()
+        deadline = started + options['duration']
+        if concurrency == 1:
+            load.worker(0, mix, deadline, budget)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for future in [executor.submit(load.thread_worker, number,
+                                               mix, deadline, budget)
+                               for number in range(concurrency)]:
+                    future.result()
+        report = stats.report(time.monotonic() - started)
+        report.update(target=target, concurrency=concurrency, mix=mix,
+                      seed=options['seed'])
+        return report
+
+    def print_report(self, report):
+        header = ('эндпоинт', 'запросов', 'ошибок', 'rps',
+                  'p50, мс', 'p95, мс', 'p99, мс')
+        width = max([len(header[0])] + [
+            len(endpoint) for endpoint in report['endpoints']])
+        self.stdout.write(header[0].ljust(width) + ''.join(
+            column.rjust(10) for column in header[1:]))
+        for endpoint, item in report['endpoints'].items():
+            self.stdout.write(endpoint.ljust(width) + ''.join(
+                f'{value:>10.1f}' if isinstance(value, float)
+                else f'{value:>10}' for value in (
+                    item['requests'], item['errors'], item['throughput'],
+                    item['p50_ms'], item['p95_ms'], item['p99_ms'])))
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {report["requests"]} запросов за '
+            f'{report["elapsed"]:.1f} с: {report["throughput"]:.1f} rps, '
+            f'ошибок {report["errors"]}'))
@@ -0,0 +1,164 @@
+"""Метрики Prometheus для API, базы данных, кэшей и очередей.
+
+Если при запуске задана переменная окружения PROMETHEUS_MULTIPROC_DIR,
+prometheus_client хранит значения в файлах этого каталога, и /metrics
+суммирует их по всем процессам gunicorn. Без prometheus_client метрики
+не собираются, при METRICS_ENABLED = False не отдаются и не пишутся
+метрики запросов.
+"""
+import os
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Count
+from django.http import Http404, HttpResponse
+
+from jobs.models import Job
+from .profiling import QueryTimer
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    # Каталог создается до первой метрики: иначе prometheus_client
+    # падает в процессах, запущенных не через gunicorn (manage.py).
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class NullMetric:
+    """Заглушка метрики на случай, когда prometheus_client не установлен."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, value=1):
+        pass
+
+    def dec(self, value=1):
+        pass
+
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        'foodgram_request_duration_seconds', 'Время ответа API',
+        ('view', 'method'), buckets=LATENCY_BUCKETS)
+    REQUESTS = prometheus_client.Counter(
+        'foodgram_requests', 'Запросы к API по статусу ответа',
+        ('view', 'method', 'status'))
+    DB_QUERIES = prometheus_client.Histogram(
+        'foodgram_db_queries_per_request', 'Число SQL-запросов на запрос',
+        ('view',), buckets=QUERY_BUCKETS)
+    DB_TIME = prometheus_client.Histogram(
+        'foodgram_db_duration_seconds', 'Время SQL-запросов на запрос',
+        ('view',), buckets=LATENCY_BUCKETS)
+    IMAGE_QUEUE = prometheus_client.Gauge(
+        'foodgram_image_queue_pending',
+        'Картинки в очереди пула обработки',
+        multiprocess_mode='livesum')
+    CACHE_HITS = prometheus_client.Counter(
+        'foodgram_cache_hits', 'Попадания в кэш ответов', ('cache',))
+    CACHE_MISSES = prometheus_client.Counter(
+        'foodgram_cache_misses', 'Промахи кэша ответов', ('cache',))
+else:
+    REQUEST_LATENCY = REQUESTS = DB_QUERIES = DB_TIME = NullMetric()
+    IMAGE_QUEUE = CACHE_HITS = CACHE_MISSES = NullMetric()
+
+
+def process_registry():
+    """Реестр метрик процессов: суммы по всем процессам gunicorn в
+    режиме multiprocess, иначе метрики этого процесса."""
+    if MULTIPROC_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+        return registry
+    return prometheus_client.REGISTRY
+
+
+def cache_stats(name):
+    """Попадания и промахи кэша name, суммированные по процессам."""
+    families = {'foodgram_cache_hits': 'hits',
+                'foodgram_cache_misses': 'misses'}
+    counts = dict.fromkeys(families.values(), 0)
+    if prometheus_client is not None:
+        for metric in process_registry().collect():
+            if metric.name in families:
+                counts[families[metric.name]] += int(sum(
+                    sample.value for sample in metric.samples
+                    if sample.name.endswith('_total')
+                    and sample.labels.get('cache') == name))
+    total = counts['hits'] + counts['misses']
+    return {**counts, 'hit_ratio': counts['hits'] / total if total else 0}
+
+
+class StateCollector:
+    """Метрики, которые читаются при каждом опросе из базы и поэтому
+    одинаковы для всех процессов."""
+
+    def collect(self):
+        jobs = GaugeMetricFamily(
+            'foodgram_jobs_pending', 'Фоновые задачи в очереди',
+            labels=('name',))
+        for name, count in Job.objects.filter(status=Job.PENDING).values_list(
+                'name').annotate(count=Count('id')).order_by('name'):
+            jobs.add_metric((name,), count)
+        yield jobs
+
+
+def metrics_view(request):
+    """Отдает метрики в текстовом формате Prometheus."""
+    if prometheus_client is None or not settings.METRICS_ENABLED:
+        raise Http404
+    state = prometheus_client.CollectorRegistry(auto_describe=True)
+    state.register(StateCollector())
+    return HttpResponse(
+        prometheus_client.generate_latest(process_registry())
+        + prometheus_client.generate_latest(state),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """Записывает время ответа, статус и SQL-запросы каждого запроса.
+
+    На запрос приходится несколько обращений к счетчикам в памяти или
+    в mmap-файле, что незаметно на фоне самого запроса.
+    """
+
+    def __init__(self, get_response):
+        if prometheus_client is None or not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == '/metrics':
+            return self.get_response(request)
+        timer = QueryTimer()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        method = request.method if request.method in METHODS else 'other'
+        REQUEST_LATENCY.labels(view, method).observe(duration)
+        REQUESTS.labels(view, method, response.status_code).inc()
+        DB_QUERIES.labels(view).observe(timer.count)
+        DB_TIME.labels(view).observe(timer.duration)
+        return response
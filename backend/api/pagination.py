@@ -1,6 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class PagePagination(PageNumberPagination):
+    """Постраничная пагинация с необязательным режимом курсора.
+
+    Режим курсора включается параметром pagination=cursor и продолжается
+    по ссылкам next/previous. Он не считает COUNT(*) и не использует
+    OFFSET, а ответ сохраняет поля count/next/previous/results,
+    где count равен None.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = 6
+    cursor_pagination_class = None
+    cursor = None
+
+    def use_cursor(self, request):
+        return self.cursor_pagination_class is not None and (
+            request.query_params.get('pagination') == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor = self.cursor_pagination_class()
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.cursor.get_next_link()),
+            ('previous', self.cursor.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class RecipeCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = ('-date_create', '-id')
+
+
+class UserCursorPagination(CursorPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    ordering = ('username', 'id')
+
+
+class RecipePagination(PagePagination):
+    cursor_pagination_class = RecipeCursorPagination
+
+
+class UserPagination(PagePagination):
+    cursor_pagination_class = UserCursorPagination
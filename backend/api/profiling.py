@@ -0,0 +1,195 @@
+"""Замеры времени запросов к API в заголовке Server-Timing.
+
+Включается настройкой SERVER_TIMING. Выключенный middleware Django
+убирает из цепочки, а замеры в коде API сводятся к чтению ContextVar.
+Для администратора запрос с заголовком X-Profile: 1 или параметром
+?profile=1 дополнительно профилируется cProfile, а профиль и список
+SQL-запросов сохраняются в PROFILE_DIR.
+"""
+import cProfile
+import io
+import os
+import pstats
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter, strftime
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+_timings = ContextVar('server_timings', default=None)
+
+PROFILE_STATS_LIMIT = 50
+
+
+@contextmanager
+def measure(name):
+    """Добавляет время выполнения блока к замеру name текущего запроса."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + perf_counter() - started
+
+
+_measured_classes = {}
+
+
+def measured(serializer):
+    """Возвращает serializer, у которого обращение к data добавляется
+    к замеру serialize текущего запроса.
+
+    Меняется класс только этого объекта, сам DRF не патчится. Вложенные
+    сериализаторы вызывают to_representation, а не data, поэтому время
+    учитывается один раз на сериализатор верхнего уровня.
+    """
+    if _timings.get() is None:
+        return serializer
+    cls = type(serializer)
+    measured_class = _measured_classes.get(cls)
+    if measured_class is None:
+        data = cls.data.fget
+
+        def measured_data(self):
+            with measure('serialize'):
+                return data(self)
+
+        measured_class = type(cls.__name__, (cls,), {
+            '__module__': cls.__module__, 'data': property(measured_data)})
+        _measured_classes[cls] = measured_class
+    serializer.__class__ = measured_class
+    return serializer
+
+
+class MeasuredSerializerMixin:
+    """Миксин вьюсета: сериализаторы из get_serializer замеряются."""
+
+    def get_serializer(self, *args, **kwargs):
+        return measured(super().get_serializer(*args, **kwargs))
+
+
+class QueryTimer:
+    """Обертка выполнения SQL, считающая число и время запросов."""
+
+    def __init__(self, keep_queries=False):
+        self.count = 0
+        self.duration = 0
+        self.queries = [] if keep_queries else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.queries is not None:
+                self.queries.append((duration, sql, params))
+
+
+class ServerTimingMiddleware:
+    """Добавляет к ответам API заголовок Server-Timing с временем SQL,
+    сериализации, рендеринга и всего запроса."""
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        profile = self.wants_profile(request)
+        timings = {}
+        timer = QueryTimer(keep_queries=profile)
+        token = _timings.set(timings)
+        request.server_timings = timings
+        profiler = cProfile.Profile() if profile else None
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _timings.reset(token)
+        total = perf_counter() - started
+
+        metrics = [f'db;dur={timer.duration * 1000:.2f};'
+                   f'desc="{timer.count} queries"']
+        metrics += [f'{name};dur={duration * 1000:.2f}'
+                    for name, duration in timings.items()]
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        response['Server-Timing'] = ', '.join(metrics)
+        if profiler is not None:
+            response['X-Profile-Dump'] = self.dump(request, profiler, timer)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'server_timings', None)
+        if timings is not None:
+            started = perf_counter()
+
+            def rendered(response):
+                timings['render'] = (timings.get('render', 0)
+                                     + perf_counter() - started)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def wants_profile(self, request):
+        """Профилирование только по явному запросу администратора.
+
+        Аутентификация DRF выполняется здесь заранее, поэтому лишний
+        запрос к базе бывает лишь у запросов с флагом профилирования.
+        """
+        if (request.headers.get('X-Profile') != '1'
+                and request.GET.get('profile') != '1'):
+            return False
+        try:
+            user = Request(request, authenticators=[
+                authentication() for authentication
+                in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+        except APIException:
+            return False
+        return user.is_authenticated and user.is_admin
+
+    def dump(self, request, profiler, timer):
+        """Сохраняет профиль и SQL-запросы и возвращает имя файла."""
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        # pid и случайный суффикс: за одну секунду профили могут снять
+        # несколько воркеров или несколько запросов одного воркера.
+        name = '{}-{}-{}-{}-{}'.format(
+            strftime('%Y%m%d-%H%M%S'), os.getpid(), uuid4().hex[:8],
+            request.method, request.path.strip('/').replace('/', '_'))
+        path = os.path.join(settings.PROFILE_DIR, name)
+        profiler.dump_stats(f'{path}.prof')
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            'cumulative').print_stats(PROFILE_STATS_LIMIT)
+        with open(f'{path}.txt', 'w', encoding='utf-8') as file:
+            file.write(f'{request.method} {request.get_full_path()}\n\n')
+            file.write(f'SQL: {timer.count} запросов, '
+                       f'{timer.duration * 1000:.2f} мс\n\n')
+            for duration, sql, params in timer.queries:
+                file.write(f'{duration * 1000:.2f} мс: {sql}; {params}\n')
+            file.write('\n')
+            file.write(stream.getvalue())
+        return f'{name}.txt'
@@ -0,0 +1,70 @@
+from django.db import connections, router
+from django.db.models import Exists, OuterRef
+
+CREATED = 'created'
+EXISTS = 'exists'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+DELETED = 'deleted'
+ABSENT = 'absent'
+
+
+def insert_ignore(obj):
+    """Вставляет объект одним INSERT ... ON CONFLICT DO NOTHING и
+    возвращает, была ли строка добавлена.
+
+    Результат определяет число вставленных строк, а не предварительная
+    проверка, поэтому из двух одновременных запросов (двойной клик)
+    строку добавляет ровно один, а второй получает False.
+    """
+    model = type(obj)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [field for field in model._meta.local_concrete_fields
+              if not field.primary_key]
+    params = [field.get_db_prep_save(field.pre_save(obj, True), connection)
+              for field in fields]
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def add_many(model, field, targets, user, ids, forbidden=()):
+    """Связывает пользователя со всеми объектами ids из targets.
+
+    Одним запросом выясняется, какие объекты есть и какие уже связаны,
+    затем новые связи вставляются одним INSERT ... ON CONFLICT DO
+    NOTHING. Возвращает статус для каждого id.
+    """
+    linked = model.objects.filter(user=user, **{field: OuterRef('pk')})
+    found = dict(targets.filter(pk__in=ids).annotate(
+        linked=Exists(linked)).values_list('pk', 'linked'))
+    results = {}
+    for pk in ids:
+        if pk not in found:
+            results[pk] = NOT_FOUND
+        elif pk in forbidden:
+            results[pk] = FORBIDDEN
+        elif found[pk]:
+            results[pk] = EXISTS
+        else:
+            results[pk] = CREATED
+    model.objects.bulk_create(
+        [model(user=user, **{f'{field}_id': pk})
+         for pk, result in results.items() if result == CREATED],
+        ignore_conflicts=True)
+    return results
+
+
+def delete_many(model, field, user, ids):
+    """Удаляет связи пользователя с объектами ids одним DELETE ... WHERE
+    IN и возвращает статус для каждого id."""
+    queryset = model.objects.filter(user=user, **{f'{field}_id__in': ids})
+    linked = set(queryset.values_list(f'{field}_id', flat=True))
+    if linked:
+        queryset.delete()
+    return {pk: DELETED if pk in linked else ABSENT for pk in ids}
@@ -0,0 +1,186 @@
+import csv
+import io
+import logging
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from django.db.models import F, Sum
+from rest_framework import exceptions, renderers, status
+
+from recipes.models import IngredientAmount
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+logger = logging.getLogger(__name__)
+
+SHOPPING_LIST_TITLE = 'Ваш список покупок:'
+
+
+class ShoppingListUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Список покупок в этом формате сейчас недоступен.'
+    default_code = 'shopping_list_unavailable'
+
+
+def shopping_list_rows(user):
+    """Суммирует ингредиенты рецептов из списка покупок одним запросом."""
+    return IngredientAmount.objects.filter(
+        recipe__cart_user__user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit')
+    ).annotate(total=Sum('amount')).order_by('name')
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """Рендерер json на orjson.
+
+    Ответ совпадает с JSONRenderer побайтно: типы, которых orjson не
+    знает или пишет иначе (даты, Decimal, ленивые строки перевода),
+    отдаются кодировщику DRF. Без orjson и для ответов с отступами
+    (browsable API) используется обычный JSONRenderer.
+    """
+
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+               if orjson else None)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(
+                accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=self.options)
+        # Как и JSONRenderer, экранируем разделители строк для javascript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class Echo:
+    """Буфер, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(renderers.BaseRenderer, metaclass=ABCMeta):
+    """Базовый рендерер списка покупок.
+
+    Список отдается потоком через stream(), а render() используется
+    только для ответов с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode('utf-8')
+
+    def prepare(self):
+        """Проверяет до начала ответа, что файл можно собрать, чтобы
+        ошибка не оборвала уже начатый поток."""
+
+    @abstractmethod
+    def stream(self, rows):
+        """Возвращает генератор частей файла по строкам из базы."""
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в виде текстового файла."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield f'{SHOPPING_LIST_TITLE} \n\n'
+        for row in rows:
+            yield (f'{row["name"]} - {row["total"]} '
+                   f'({row["measurement_unit"]})\n')
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате csv."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения'))
+        for row in rows:
+            yield writer.writerow(
+                (row['name'], row['total'], row['measurement_unit']))
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате pdf.
+
+    reportlab записывает документ только при сохранении, поэтому pdf
+    собирается в памяти целиком и отдается клиенту частями.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 50
+    chunk_size = 64 * 1024
+
+    def prepare(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_FONT))
+        except TTFError:
+            # Встроенные шрифты pdf не содержат кириллицы.
+            logger.exception('Не удалось загрузить шрифт %s',
+                             settings.SHOPPING_LIST_FONT)
+            raise ShoppingListUnavailable
+
+    def stream(self, rows):
+        self.prepare()
+        buffer = io.BytesIO()
+        document = canvas.Canvas(buffer, pagesize=A4)
+        height = A4[1]
+        line_height = self.font_size * 1.5
+
+        document.setFont(self.font_name, self.font_size + 4)
+        y = height - self.margin
+        document.drawString(self.margin, y, SHOPPING_LIST_TITLE)
+        y -= line_height * 2
+        document.setFont(self.font_name, self.font_size)
+        for row in rows:
+            if y < self.margin:
+                document.showPage()
+                document.setFont(self.font_name, self.font_size)
+                y = height - self.margin
+            document.drawString(
+                self.margin, y,
+                f'{row["name"]} - {row["total"]} '
+                f'({row["measurement_unit"]})')
+            y -= line_height
+        document.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+
+SHOPPING_LIST_RENDERERS = (TextShoppingListRenderer,
+                           CSVShoppingListRenderer)
+if canvas is not None:
+    SHOPPING_LIST_RENDERERS += (PDFShoppingListRenderer,)
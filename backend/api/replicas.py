@@ -0,0 +1,143 @@
+"""Чтение с реплик базы данных.
+
+Запросы GET, HEAD и OPTIONS читают с одной из реплик DATABASE_REPLICAS,
+все записи и остальные запросы идут в основную базу. После записи
+клиент получает cookie, и следующие REPLICA_MAX_LAG секунд все его
+запросы читают из основной базы, чтобы он сразу видел свои изменения.
+Реплики PostgreSQL, отстающие больше чем на REPLICA_MAX_LAG секунд,
+временно не используются. Данные, которые сохраняются в кэш или в
+память процесса, читаются из основной базы (см. read_from_primary).
+"""
+import math
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PRIMARY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_replica_state', default=None)
+
+
+class RequestState:
+    """База для чтения в текущем запросе и признак записи в нем."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+class ReplicaLag:
+    """Отставание реплик, которое перепроверяется не чаще раза
+    в REPLICA_CHECK_INTERVAL секунд в каждом процессе."""
+
+    def __init__(self):
+        self.checked = {}
+
+    def measure(self, alias):
+        """Отставание реплики в секундах; None, если она недоступна."""
+        connection = connections[alias]
+        try:
+            if connection.vendor != 'postgresql':
+                return 0
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT CASE WHEN pg_last_wal_receive_lsn() '
+                    '= pg_last_wal_replay_lsn() THEN 0 ELSE EXTRACT(EPOCH '
+                    'FROM now() - pg_last_xact_replay_timestamp()) END')
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+        return float(lag or 0)
+
+    def healthy(self, alias):
+        now = monotonic()
+        checked_at, lag = self.checked.get(alias, (None, None))
+        if checked_at is None or (
+                now - checked_at > settings.REPLICA_CHECK_INTERVAL):
+            lag = self.measure(alias)
+            self.checked[alias] = now, lag
+        return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+
+replica_lag = ReplicaLag()
+
+
+def choose_replica():
+    """Случайная реплика из не отстающих; None - читать из основной."""
+    replicas = [alias for alias in settings.DATABASE_REPLICAS
+                if replica_lag.healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def read_from_primary():
+    """Чтение внутри блока из основной базы без закрепления клиента.
+
+    Нужно для данных, которые попадут в кэш или в справочники в памяти:
+    прочитанное с отстающей реплики хранилось бы там под новой версией
+    намного дольше REPLICA_MAX_LAG.
+    """
+    state = _state.get()
+    if state is None or state.replica is None:
+        yield
+        return
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaRouter:
+    """Роутер: чтение внутри запроса - с выбранной для него реплики,
+    запись и все запросы вне HTTP-запроса - в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.wrote:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения на время запроса и закрепляет клиента
+    за основной базой после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = None
+        if (settings.DATABASE_REPLICAS
+                and request.method in SAFE_METHODS
+                and PRIMARY_COOKIE not in request.COOKIES):
+            replica = choose_replica()
+        state = RequestState(replica)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=math.ceil(settings.REPLICA_MAX_LAG),
+                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,104 @@
+import threading
+from bisect import bisect_left
+from time import monotonic
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+from .cache import ingredients_cache
+from .replicas import read_from_primary
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: без регистра, е вместо ё
+    и с одиночными пробелами."""
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """Отсортированный индекс справочника ингредиентов в памяти процесса.
+
+    Индекс строится при первом поиске и сбрасывается сигналами при
+    изменении ингредиентов в этом процессе. Изменения из других
+    процессов (правка в админке, upload_ingredients) он замечает, как
+    и Catalog, по версии справочника в кэше Django, которая сверяется
+    не чаще раза в check_interval секунд, а с локальным кэшем
+    перестраивается не реже раза в ttl секунд.
+    """
+
+    def __init__(self, catalog_cache, ttl, check_interval):
+        self.catalog_cache = catalog_cache
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (keys, entries, built_at, version) заменяется целиком одним
+        # присваиванием, поэтому поиск без блокировки всегда видит
+        # согласованный снимок.
+        self._snapshot = None
+        self._generation = 0
+        self._checked_at = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._snapshot = None
+
+    def _fresh(self, snapshot):
+        now = monotonic()
+        if snapshot is None or now - snapshot[2] > self.ttl:
+            return False
+        if now - self._checked_at < self.check_interval:
+            return True
+        self._checked_at = now
+        return self.catalog_cache.version() == snapshot[3]
+
+    def _load(self):
+        with self._lock, read_from_primary():
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                return snapshot
+            generation = self._generation
+            version = self.catalog_cache.version()
+            entries = sorted(
+                (normalize(name), pk, name, measurement_unit)
+                for pk, name, measurement_unit in
+                Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'))
+            snapshot = ([entry[0] for entry in entries], entries,
+                        monotonic(), version)
+            self._checked_at = snapshot[2]
+            # Индекс, сброшенный во время построения, мог прочитать
+            # данные до изменения, поэтому он не сохраняется.
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    def search(self, query, limit):
+        """Возвращает ингредиенты, название которых начинается с query,
+        а следом за ними те, что содержат query в середине."""
+        snapshot = self._snapshot
+        if not self._fresh(snapshot):
+            snapshot = self._load()
+        keys, entries, _, _ = snapshot
+        query = normalize(query)
+        found = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(entries[position])
+            position += 1
+        if len(found) < limit:
+            for entry in entries:
+                key = entry[0]
+                if query in key and not key.startswith(query):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return [
+            Ingredient(id=pk, name=name, measurement_unit=measurement_unit)
+            for _, pk, name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientIndex(
+    ingredients_cache, settings.INGREDIENT_INDEX_TTL,
+    settings.CATALOG_VERSION_CHECK_INTERVAL)
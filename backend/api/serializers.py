@@ -1,12 +1,18 @@
-import base64
-
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password, check_password
-from django.core.files.base import ContentFile
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
 
+from jobs.models import Job
 from recipes.models import (Tag, Ingredient, Recipe,
                             IngredientAmount)
+from .cache import recipe_list_cache
+from .catalog import ingredient_catalog
+from .renderers import SHOPPING_LIST_RENDERERS
+from .images import (decode_base64_image, schedule_image_processing,
+                     variant_urls)
 
 User = get_user_model()
 
@@ -17,6 +23,8 @@ class IsSubscribedSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request.user.is_authenticated:
             return obj.following.filter(user=request.user).exists()
@@ -91,6 +99,13 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         model = IngredientAmount
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
+    def to_representation(self, instance):
+        if not IngredientAmount.ingredient.is_cached(instance):
+            ingredient = ingredient_catalog.get(instance.ingredient_id)
+            if ingredient is not None:
+                instance.ingredient = ingredient
+        return super().to_representation(instance)
+
 
 class Base64ImageField(serializers.ImageField):
     """Сериализатор для обработки изображения."""
@@ -104,7 +119,7 @@ class Base64ImageField(serializers.ImageField):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = decode_base64_image(imgstr, 'temp.' + ext)
 
         return super().to_internal_value(data)
 
@@ -119,14 +134,22 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('user')
         if user.is_authenticated:
             return obj.favorite_user.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('user')
         if user.is_authenticated:
             return obj.cart_user.filter(user=user).exists()
@@ -135,63 +158,126 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
-                  'text', 'cooking_time', 'is_favorited',
+                  'image_variants', 'text', 'cooking_time', 'is_favorited',
                   'is_in_shopping_cart')
         read_only_fields = ('author',)
         depth = 1
 
-    def create_update_ingredients(self, recipe):
-        if 'ingredients' in self.initial_data:
-            ingredients = self.initial_data.get('ingredients')
-            amount_list = []
-            for ingredient in ingredients:
-                id = ingredient.get('id')
-                amount = ingredient.get('amount')
-                amount_item = IngredientAmount(
-                    ingredient_id=int(id), recipe=recipe, amount=amount
-                )
-                amount_list.append(amount_item)
-            IngredientAmount.objects.bulk_create(amount_list)
-        else:
-            raise serializers.ValidationError(
-                {'ingredients': ['Обязательное поле.']})
-
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def initial_list(self, name):
+        if name not in self.initial_data:
+            raise serializers.ValidationError({name: ['Обязательное поле.']})
+        return self.initial_data.get(name)
+
+    def ingredient_amounts(self):
+        return {
+            int(item.get('id')): int(item.get('amount'))
+            for item in self.initial_list('ingredients')
+        }
+
+    @transaction.atomic
     def create(self, validated_data):
+        amounts = self.ingredient_amounts()
+        tags = self.initial_list('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_update_ingredients(recipe)
-        if 'tags' in self.initial_data:
-            tags = self.initial_data.get('tags')
-            recipe.tags.set(tags)
-        else:
-            raise serializers.ValidationError(
-                {'tags': ['Обязательное поле.']})
-        recipe.save()
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(ingredient_id=ingredient_id, recipe=recipe,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items())
+        recipe.tags.set(tags)
+        schedule_image_processing(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, amounts):
+        """Приводит ингредиенты рецепта к amounts, меняя только
+        отличающиеся строки.
+
+        Вызывается под блокировкой строки рецепта (см. update), поэтому
+        текущие строки читаются заново, а не из prefetch.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientAmount.objects.filter(recipe=recipe)
+        }
+        removed = [item.pk for ingredient_id, item in current.items()
+                   if ingredient_id not in amounts]
+        added, changed = [], []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                added.append(IngredientAmount(
+                    ingredient_id=ingredient_id, recipe=recipe,
+                    amount=amount))
+            elif item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            IngredientAmount.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        if added:
+            IngredientAmount.objects.bulk_create(added)
+        if changed or added:
+            # bulk_update и bulk_create не отправляют сигналы.
+            recipe_list_cache.bump_recipe(recipe.pk)
+
+    def update_tags(self, recipe, tags):
+        current = {tag.pk for tag in recipe.tags.all()}
+        tags = {int(tag) for tag in tags}
+        if current - tags:
+            recipe.tags.remove(*(current - tags))
+        if tags - current:
+            recipe.tags.add(*(tags - current))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        self.create_update_ingredients(instance)
-        if 'tags' in self.initial_data:
-            tags = self.initial_data.get('tags')
-            instance.tags.set(tags)
-        else:
-            raise serializers.ValidationError(
-                {'tags': ['Обязательное поле.']})
-        instance.__dict__.update(**validated_data)
-        instance.save()
+        """Обновляет рецепт, записывая только изменившиеся поля и строки.
+
+        При PATCH ингредиенты и теги меняются, только если переданы.
+        Строка рецепта блокируется до конца транзакции, чтобы два
+        одновременных запроса не добавили один ингредиент дважды.
+        """
+        Recipe.objects.select_for_update().filter(
+            pk=instance.pk).values_list('pk').get()
+        if not self.partial or 'ingredients' in self.initial_data:
+            self.update_ingredients(instance, self.ingredient_amounts())
+        if not self.partial or 'tags' in self.initial_data:
+            self.update_tags(instance, self.initial_list('tags'))
+        if 'image' in validated_data:
+            validated_data['image_variants'] = {}
+        update_fields = [
+            field for field, value in validated_data.items()
+            if field in ('image', 'image_variants')
+            or getattr(instance, field) != value
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        if update_fields:
+            instance.save(update_fields=update_fields)
+        if 'image' in validated_data:
+            schedule_image_processing(instance)
         return instance
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для сокращенной модели рецептов."""
     image = Base64ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'image', 'cooking_time',
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
         )
-        read_only_fields = ('id', 'name', 'image', 'cooking_time')
+        read_only_fields = ('id', 'name', 'image', 'image_variants',
+                            'cooking_time')
 
 
 class FollowSerializer(IsSubscribedSerializer):
@@ -201,6 +287,8 @@ class FollowSerializer(IsSubscribedSerializer):
     recipes = RecipeShortSerializer(many=True, read_only=True)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     class Meta:
@@ -211,50 +299,48 @@ class FollowSerializer(IsSubscribedSerializer):
                             'last_name', 'is_subscribed', 'recipes',
                             'recipes_count')
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit is not None and recipes_limit.isdigit():
-            recipes_limit = int(recipes_limit)
-            data['recipes'] = data['recipes'][:recipes_limit]
 
-        return data
+class JobSerializer(serializers.ModelSerializer):
+    """Сериализатор статуса фоновой задачи."""
 
+    file = serializers.SerializerMethodField()
 
-class FollowSubscribeSerializer(FollowSerializer):
-    """Сериализатор для валидации подписок."""
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'result', 'file', 'attempts',
+                  'date_create', 'date_update')
+        read_only_fields = fields
+
+    def get_file(self, obj):
+        """Ссылка на скачивание файла, собранного задачей."""
+        if obj.status != Job.DONE or not (obj.result or {}).get('file'):
+            return None
+        url = reverse('api:jobs-file', args=(obj.pk,))
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
-    def validate(self, data):
-        author = self.instance
-        request = self.context['request']
-        if request.user == author:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя')
-        if author.following.filter(user=request.user).exists():
-            raise serializers.ValidationError('Нельзя подписаться второй раз')
-        return data
 
+class ShoppingListJobSerializer(serializers.Serializer):
+    """Сериализатор параметров сборки файла списка покупок."""
 
-class FavoriteSerializer(RecipeShortSerializer):
-    """Сериализатор для валидации избранных рецептов."""
+    file_format = serializers.ChoiceField(
+        choices=[renderer.format for renderer in SHOPPING_LIST_RENDERERS],
+        default='txt')
 
-    def validate(self, data):
-        recipe = self.instance
-        user = self.context['user']
-        if recipe.favorite_user.filter(user=user).exists():
-            raise serializers.ValidationError(
-                'Нельзя добавить в избранное второй раз')
-        return data
 
+class BatchSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетного добавления и удаления."""
 
-class ShoppingCartSerializer(RecipeShortSerializer):
-    """Сериализатор для списка покупок."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False)
 
-    def validate(self, data):
-        recipe = self.instance
-        user = self.context['user']
-        if recipe.cart_user.filter(user=user).exists():
+    def validate_ids(self, ids):
+        # Лимит читается при проверке, а не при импорте модуля, чтобы
+        # его можно было поменять в настройках.
+        ids = list(dict.fromkeys(ids))
+        max_size = settings.RELATION_BATCH_MAX_SIZE
+        if len(ids) > max_size:
             raise serializers.ValidationError(
-                'Рецепт уже добавлен в список покупок')
-        return data
+                f'Не больше {max_size} id за один запрос')
+        return ids
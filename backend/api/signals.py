@@ -0,0 +1,105 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from .authentication import TOKEN_CLAIMS, token_denylist
+from .cache import ingredients_cache, recipe_list_cache, tags_cache
+from .catalog import ingredient_catalog, tag_catalog
+from .search import ingredient_index
+
+
+# Кэши сбрасываются после фиксации транзакции: сброшенный раньше кэш
+# успел бы заполниться старыми данными из параллельного запроса и
+# хранил бы их под новой версией.
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    def invalidate():
+        ingredient_index.invalidate()
+        ingredient_catalog.invalidate()
+        ingredients_cache.bump()
+        recipe_list_cache.bump()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    def invalidate():
+        tag_catalog.invalidate()
+        tags_cache.bump()
+        recipe_list_cache.bump()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(recipe_list_cache.bump)
+    else:
+        transaction.on_commit(
+            partial(recipe_list_cache.bump_recipe, instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_list(sender, **kwargs):
+    transaction.on_commit(recipe_list_cache.bump)
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(recipe_list_cache.bump_recipe, instance.recipe_id))
+
+
+# Поля автора, которые попадают в страницы списка рецептов.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=get_user_model())
+def remember_author_change(sender, instance, update_fields=None, **kwargs):
+    """При полном сохранении существующего пользователя сверяет поля
+    автора с базой, чтобы, например, смена пароля не сбрасывала кэш."""
+    if instance.pk is None or update_fields is not None:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(
+        *AUTHOR_FIELDS).first()
+    instance._author_changed = old is None or any(
+        old[field] != getattr(instance, field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_author(sender, instance, created, update_fields=None,
+                      **kwargs):
+    # У нового пользователя еще нет рецептов.
+    if created:
+        return
+    if update_fields is None:
+        changed = getattr(instance, '_author_changed', True)
+    else:
+        changed = not set(update_fields).isdisjoint(AUTHOR_FIELDS)
+    if changed:
+        transaction.on_commit(recipe_list_cache.bump)
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """Отзывает JWT пользователя при смене пароля, роли или блокировке:
+    роль в токене устаревает, а проверка is_active в нем не делается."""
+    if not created and (update_fields is None or not set(
+            update_fields).isdisjoint(('password', 'is_active')
+                                      + TOKEN_CLAIMS)):
+        token_denylist.revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    token_denylist.revoke_user(instance.pk)
@@ -0,0 +1,45 @@
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from jobs.queue import task
+from .images import process_recipe_image
+from .renderers import SHOPPING_LIST_RENDERERS, shopping_list_rows
+
+User = get_user_model()
+
+task('process_recipe_image')(process_recipe_image)
+
+
+def private_storage():
+    """Хранилище файлов, которые nginx не раздает: их отдает API
+    только владельцу."""
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT)
+
+
+def delete_shopping_list(result):
+    """Удаляет файл списка покупок истекшей задачи."""
+    if result and result.get('file'):
+        private_storage().delete(result['file'])
+
+
+@task('shopping_list', cleanup=delete_shopping_list)
+def build_shopping_list(user_id, file_format):
+    """Собирает файл списка покупок и возвращает путь к нему в закрытом
+    хранилище; скачать его можно по /api/jobs/<id>/file/."""
+    renderer = {
+        renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS
+    }[file_format]()
+    user = User.objects.get(pk=user_id)
+    with tempfile.TemporaryFile() as file:
+        for chunk in renderer.stream(shopping_list_rows(user).iterator()):
+            file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        file.seek(0)
+        path = private_storage().save(
+            f'shopping_lists/{user_id}/{uuid.uuid4().hex}.{file_format}',
+            File(file))
+    return {'file': path, 'format': file_format}
@@ -12,8 +12,15 @@ router_v1.register(r'ingredients', views.IngredientViewSet,
                    basename='ingredients')
 router_v1.register(r'recipes', views.RecipeViewSet, basename='recipes')
 router_v1.register(r'users', views.UserViewSet, basename='users')
+router_v1.register(r'jobs', views.JobViewSet, basename='jobs')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('auth/jwt/create/', views.TokenObtainView.as_view(),
+         name='jwt-create'),
+    path('auth/jwt/refresh/', views.TokenRefreshView.as_view(),
+         name='jwt-refresh'),
+    path('auth/jwt/logout/', views.TokenLogoutView.as_view(),
+         name='jwt-logout'),
     path('', include(router_v1.urls)),
 ]
@@ -1,31 +1,115 @@
-import io
+from functools import partial
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (Count, Exists, OuterRef, Prefetch, Value,
+                              prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import mixins, serializers, status, viewsets
+from rest_framework import generics, mixins, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from rest_framework_simplejwt import views as jwt_views
+from rest_framework_simplejwt.tokens import AccessToken
 
+from jobs.models import Job
+from jobs.queue import enqueue
 from recipes.models import (Tag, Ingredient, Recipe, Follow, Favorite,
                             ShoppingCart, IngredientAmount)
+from .authentication import (TokenLogoutSerializer, TokenObtainSerializer,
+                             TokenRefreshSerializer, load_user,
+                             token_denylist)
+from .cache import ingredients_cache, recipe_list_cache, tags_cache
+from .catalog import ingredient_catalog, tag_catalog
 from .filters import RecipeFilter, IngredientFilter
-from .pagination import PagePagination
+from .flat import recipe_instance, recipe_rows, represent_recipes
+from .pagination import RecipePagination, UserPagination
+from .relations import add_many, delete_many, insert_ignore
+from .renderers import SHOPPING_LIST_RENDERERS, shopping_list_rows
 from .permissions import ReadOnly, IsAdmin, IsAuthor
+from .profiling import MeasuredSerializerMixin, measure, measured
+from .tasks import private_storage
 from .serializers import (TagSerializer, IngredientSerializer,
                           RecipeSerializer,
                           UserSerializer,
                           ChangePasswordSerializer, FollowSerializer,
-                          FollowSubscribeSerializer, FavoriteSerializer,
-                          ShoppingCartSerializer)
+                          RecipeShortSerializer, JobSerializer,
+                          ShoppingListJobSerializer, BatchSerializer)
 
 User = get_user_model()
 
 
-class ListRetrieveViewSet(mixins.ListModelMixin,
+def error_response(message):
+    return Response({api_settings.NON_FIELD_ERRORS_KEY: [message]},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
+def batch_response(request, model, field, targets, forbidden=()):
+    """Пакетно добавляет (POST) или удаляет (DELETE) связи пользователя
+    с объектами из списка ids и возвращает результат по каждому."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    if request.method == 'POST':
+        results = add_many(model, field, targets, request.user, ids,
+                           forbidden)
+    else:
+        results = delete_many(model, field, request.user, ids)
+    return Response({'results': [
+        {'id': pk, 'status': result} for pk, result in results.items()
+    ]}, status=status.HTTP_200_OK)
+
+
+def annotate_is_subscribed(queryset, user, field='is_subscribed',
+                           author_ref='pk'):
+    """Добавляет к выборке признак подписки пользователя на автора."""
+    if not user.is_authenticated:
+        return queryset.annotate(**{field: Value(False)})
+    return queryset.annotate(**{field: Exists(Follow.objects.filter(
+        user=user, author=OuterRef(author_ref)))})
+
+
+def limit_recipes_per_author(recipes_limit, author_ids):
+    """Возвращает рецепты авторов author_ids, не больше recipes_limit
+    последних у каждого, на стороне базы данных.
+
+    Номер рецепта у автора считает ROW_NUMBER() по индексу (author_id,
+    date_create, id) только для авторов страницы, поэтому работа растет
+    с числом их рецептов, а не квадратично. Фильтровать по оконной
+    функции Django 3.2 не умеет, поэтому подзапрос написан в RawSQL.
+    """
+    recipes = Recipe.objects.order_by('-date_create', '-pk')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return recipes
+    author_ids = list(author_ids)
+    if not author_ids:
+        return recipes.none()
+    table = Recipe._meta.db_table
+    ranked = RawSQL(
+        f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+        f'PARTITION BY author_id ORDER BY date_create DESC, id DESC) '
+        f'AS position FROM {table} WHERE author_id IN '
+        f'({", ".join(["%s"] * len(author_ids))})) AS ranked '
+        f'WHERE position <= %s',
+        (*author_ids, int(recipes_limit)))
+    return recipes.filter(pk__in=ranked)
+
+
+def prefetch_author_recipes(authors, recipes_limit):
+    """Подгружает авторам последние рецепты одним запросом."""
+    prefetch_related_objects(authors, Prefetch(
+        'recipes', queryset=limit_recipes_per_author(
+            recipes_limit, [author.pk for author in authors])))
+    return authors
+
+
+class ListRetrieveViewSet(MeasuredSerializerMixin,
+                          mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
     pass
@@ -38,7 +122,11 @@ class UserViewSet(mixins.CreateModelMixin,
     permission_classes = (AllowAny,)
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    pagination_class = PagePagination
+    pagination_class = UserPagination
+
+    def get_queryset(self):
+        return annotate_is_subscribed(
+            super().get_queryset(), self.request.user)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -50,7 +138,8 @@ class UserViewSet(mixins.CreateModelMixin,
         methods=['GET'],
         permission_classes=(IsAuthenticated,))
     def me(self, request):
-        serializer = UserSerializer(request.user, context={'request': request})
+        serializer = measured(UserSerializer(
+            load_user(request.user), context={'request': request}))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
@@ -59,11 +148,11 @@ class UserViewSet(mixins.CreateModelMixin,
         permission_classes=(IsAuthenticated,))
     def set_password(self, request):
         serializer = ChangePasswordSerializer(
-            instance=request.user, data=request.data)
+            instance=load_user(request.user), data=request.data)
         if serializer.is_valid(raise_exception=True):
             new_password = serializer.validated_data.get('new_password')
             request.user.set_password(new_password)
-            request.user.save()
+            request.user.save(update_fields=['password'])
             return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -71,170 +160,351 @@ class UserViewSet(mixins.CreateModelMixin,
         methods=['GET'],
         permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        users = User.objects.filter(following__user=request.user)
+        recipes_limit = request.query_params.get('recipes_limit')
+        users = annotate_is_subscribed(
+            User.objects.filter(following__user=request.user), request.user
+        ).annotate(
+            recipes_count=Count('recipes', distinct=True)
+        ).order_by('username')
         page = self.paginate_queryset(users)
         if page is not None:
-            serializer = FollowSerializer(
-                page, many=True, context={'request': request})
+            serializer = measured(FollowSerializer(
+                prefetch_author_recipes(page, recipes_limit), many=True,
+                context={'request': request}))
             return self.get_paginated_response(serializer.data)
-        serializer = FollowSerializer(
-            users, many=True, context={'request': request})
+        serializer = measured(FollowSerializer(
+            prefetch_author_recipes(list(users), recipes_limit), many=True,
+            context={'request': request}))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe/batch')
+    def subscribe_batch(self, request):
+        return batch_response(request, Follow, 'author', User.objects,
+                              forbidden={request.user.pk})
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
         permission_classes=(IsAuthenticated,))
     def subscribe(self, request, pk=None):
-        author = get_object_or_404(User, pk=pk)
-
-        if request.method == 'POST':
-            serializer = FollowSubscribeSerializer(
-                author, data=request.data, context={'request': request})
-            if serializer.is_valid(raise_exception=True):
-                Follow.objects.create(user=request.user, author=author)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-
-        queryset = Follow.objects.filter(user=request.user, author=author)
-        if not queryset.exists():
+        """Подписка и отписка: одна вставка с пропуском дубликата или
+        одно удаление, результат которого виден по числу строк."""
+        if request.method == 'DELETE':
+            deleted, _ = Follow.objects.filter(
+                user=request.user, author_id=pk).delete()
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, pk=pk)
             return Response({'errors': 'Вы не подписаны на автора'},
                             status=status.HTTP_400_BAD_REQUEST)
-        Follow.objects.filter(user=request.user, author=author).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+        author = get_object_or_404(
+            User.objects.annotate(recipes_count=Count('recipes')), pk=pk)
+        if author == request.user:
+            return error_response('Нельзя подписаться на самого себя')
+        if not insert_ignore(Follow(user=request.user, author=author)):
+            return error_response('Нельзя подписаться второй раз')
+        prefetch_author_recipes(
+            [author], request.query_params.get('recipes_limit'))
+        author.is_subscribed = True
+        serializer = measured(
+            FollowSerializer(author, context={'request': request}))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class TagViewSet(ListRetrieveViewSet):
+class CatalogViewSet(ListRetrieveViewSet):
+    """Вьюсет справочника с кэшированием ответов и условными GET."""
+
+    catalog_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self.catalog_cache.response(
+            request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.catalog_cache.response(
+            request, partial(super().retrieve, request, *args, **kwargs))
+
+
+class TagViewSet(CatalogViewSet):
     """Вьюсет для тегов."""
 
+    catalog_cache = tags_cache
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (ReadOnly | IsAdmin,)
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(CatalogViewSet):
     """Вьюсет для ингредиентов"""
 
+    catalog_cache = ingredients_cache
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
     permission_classes = (ReadOnly | IsAdmin,)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(MeasuredSerializerMixin, viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
 
-    queryset = Recipe.objects.select_related(
-        'author').prefetch_related('tags').all()
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch('ingredientamount_set',
+                 queryset=IngredientAmount.objects.order_by('pk'))
+    ).all()
     serializer_class = RecipeSerializer
-    pagination_class = PagePagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (ReadOnly | IsAuthor | IsAdmin,)
 
-    def custom_validate(self):
-        ingredients = self.request.data.get('ingredients', None)
-        if ingredients is None or len(ingredients) == 0:
-            raise serializers.ValidationError(
-                {'ingredients': ['Обязательное поле.']})
-        ids = [item['id'] for item in ingredients]
-        if len(ids) != len(set(ids)):
-            raise serializers.ValidationError({'ingredients': [
-                'Переданы повторяющиеся ингредиенты']})
-        found_id = Ingredient.objects.filter(id__in=ids)
-        if len(ids) != found_id.count():
-            raise serializers.ValidationError({'ingredients': [
-                'Передан несуществующий ингредиент']})
-
-        tags = self.request.data.get('tags', None)
-        if tags is None or len(tags) == 0:
-            raise serializers.ValidationError(
-                {'tags': ['Обязательное поле.']})
-        if len(tags) != len(set(tags)):
-            raise serializers.ValidationError({'tags': [
-                'Переданы повторяющиеся теги']})
-        found_tags = Tag.objects.filter(id__in=tags)
-        if len(tags) != found_tags.count():
-            raise serializers.ValidationError({'tags': [
-                'Передан несуществующий тег']})
+    def custom_validate(self, partial=False):
+        """Проверяет ингредиенты и теги; при частичном обновлении
+        только те из них, что переданы."""
+        if not partial or 'ingredients' in self.request.data:
+            ingredients = self.request.data.get('ingredients', None)
+            if ingredients is None or len(ingredients) == 0:
+                raise serializers.ValidationError(
+                    {'ingredients': ['Обязательное поле.']})
+            ids = [item['id'] for item in ingredients]
+            if len(ids) != len(set(ids)):
+                raise serializers.ValidationError({'ingredients': [
+                    'Переданы повторяющиеся ингредиенты']})
+            if ingredient_catalog.missing(ids):
+                raise serializers.ValidationError({'ingredients': [
+                    'Передан несуществующий ингредиент']})
+
+        if not partial or 'tags' in self.request.data:
+            tags = self.request.data.get('tags', None)
+            if tags is None or len(tags) == 0:
+                raise serializers.ValidationError(
+                    {'tags': ['Обязательное поле.']})
+            if len(tags) != len(set(tags)):
+                raise serializers.ValidationError({'tags': [
+                    'Переданы повторяющиеся теги']})
+            if tag_catalog.missing(tags):
+                raise serializers.ValidationError({'tags': [
+                    'Передан несуществующий тег']})
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if getattr(self, 'action', None) in ('update', 'partial_update'):
+            # Текущие строки рецепта читаются под блокировкой в
+            # сериализаторе, а ответ после правки строится заново.
+            queryset = queryset.prefetch_related(None)
+        queryset = annotate_is_subscribed(
+            queryset, user,
+            field='author_is_subscribed', author_ref='author')
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False))
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+    def list(self, request, *args, **kwargs):
+        return recipe_list_cache.response(
+            request, partial(self.flat_list, request))
+
+    def flat_list(self, request):
+        """Список рецептов без сериализаторов на каждый объект."""
+        rows = recipe_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            with measure('serialize'):
+                data = represent_recipes(page)
+            return self.get_paginated_response(data)
+        with measure('serialize'):
+            data = represent_recipes(rows)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        rows = recipe_rows(self.filter_queryset(self.get_queryset()))
+        row = generics.get_object_or_404(rows, pk=kwargs[self.lookup_field])
+        self.check_object_permissions(request, recipe_instance(row))
+        with measure('serialize'):
+            data = represent_recipes([row])[0]
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAdmin,))
+    def cache_stats(self, request):
+        return Response(recipe_list_cache.stats(), status=status.HTTP_200_OK)
 
     def create(self, request, *args, **kwargs):
         self.custom_validate()
         return super().create(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
-        self.custom_validate()
+        self.custom_validate(partial=kwargs.get('partial', False))
         return super().update(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        serializer.save(author=load_user(self.request.user))
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"user": self.request.user})
         return context
 
-    def custom_create_delete(self, request, model, model_serializer, pk=None):
-        """Метод добавления/удаления рецепта в избранное или список покупок"""
-
-        recipe = get_object_or_404(Recipe, pk=pk)
-
-        if request.method == 'POST':
-            serializer = model_serializer(
-                recipe, data=request.data, context={'user': request.user})
-            if serializer.is_valid(raise_exception=True):
-                model.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-
-        queryset = model.objects.filter(
-            user=request.user, recipe=recipe)
-        if not queryset.exists():
+    def custom_create_delete(self, request, model, duplicate_error,
+                             pk=None):
+        """Метод добавления/удаления рецепта в избранное или список покупок.
+
+        Добавление - одна вставка с пропуском дубликата, удаление - один
+        DELETE, поэтому одновременные запросы не приводят к ошибке 500.
+        """
+        if request.method == 'DELETE':
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe_id=pk).delete()
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe, pk=pk)
             return Response({'errors': 'Рецепт не добавлен'},
                             status=status.HTTP_400_BAD_REQUEST)
-        else:
-            model.objects.filter(
-                user=request.user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        recipe = get_object_or_404(Recipe, pk=pk)
+        if not insert_ignore(model(user=request.user, recipe=recipe)):
+            return error_response(duplicate_error)
+        serializer = measured(RecipeShortSerializer(recipe))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
         permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
-        return self.custom_create_delete(request, Favorite,
-                                         FavoriteSerializer, pk)
+        return self.custom_create_delete(
+            request, Favorite, 'Нельзя добавить в избранное второй раз', pk)
 
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
         permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk=None):
-        return self.custom_create_delete(request, ShoppingCart,
-                                         ShoppingCartSerializer, pk)
+        return self.custom_create_delete(
+            request, ShoppingCart, 'Рецепт уже добавлен в список покупок', pk)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite/batch')
+    def favorite_batch(self, request):
+        return batch_response(request, Favorite, 'recipe', Recipe.objects)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        return batch_response(request, ShoppingCart, 'recipe',
+                              Recipe.objects)
 
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,))
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        recipes = Recipe.objects.filter(cart_user__user=request.user)
-        queryset = IngredientAmount.objects.filter(
-            recipe__in=recipes).values('ingredient').annotate(
-                total=Sum('amount'))
-        text_buffer = io.StringIO()
-        text_buffer.write('Ваш список покупок: \n\n')
-
-        for row in queryset:
-            ingredient = get_object_or_404(
-                Ingredient, pk=row.get('ingredient'))
-            total = row.get('total')
-            text_buffer.write(
-                f'{ingredient.name} - {total} ({ingredient.measurement_unit})'
-                + '\n')
-        file_data = text_buffer.getvalue()
-        response = HttpResponse(file_data, content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
+        """Отдает список покупок потоком в формате из параметра format:
+        txt (по умолчанию), csv или pdf."""
+        rows = shopping_list_rows(request.user)
+        renderer = request.accepted_renderer
+        renderer.prepare()
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows.iterator()), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"')
         return response
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        permission_classes=(IsAuthenticated,))
+    def shopping_cart_file(self, request):
+        """Ставит в очередь сборку файла списка покупок и возвращает
+        задачу, статус которой можно узнать по /api/jobs/<id>/."""
+        serializer = ShoppingListJobSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue('shopping_list', {
+            'user_id': request.user.id,
+            'file_format': serializer.validated_data['file_format']
+        }, user=request.user)
+        serializer = measured(
+            JobSerializer(job, context={'request': request}))
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class JobViewSet(MeasuredSerializerMixin, mixins.RetrieveModelMixin,
+                 viewsets.GenericViewSet):
+    """Вьюсет для статуса фоновых задач пользователя."""
+
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['GET'])
+    def file(self, request, pk=None):
+        """Отдает владельцу файл, собранный задачей."""
+        job = self.get_object()
+        path = (job.result or {}).get('file')
+        storage = private_storage()
+        if job.status != Job.DONE or not path or not storage.exists(path):
+            raise Http404
+        return FileResponse(
+            storage.open(path), as_attachment=True,
+            filename=f'shopping_list.{job.result["format"]}')
+
+
+class JWTViewMixin:
+    """Эндпоинты JWT доступны только при JWT_AUTH = True."""
+
+    def initial(self, request, *args, **kwargs):
+        if not settings.JWT_AUTH:
+            raise Http404
+        super().initial(request, *args, **kwargs)
+
+
+class TokenObtainView(JWTViewMixin, jwt_views.TokenObtainPairView):
+    """Выдача пары access- и refresh-токенов по email и паролю."""
+
+    serializer_class = TokenObtainSerializer
+
+
+class TokenRefreshView(JWTViewMixin, jwt_views.TokenRefreshView):
+    """Выдача нового access-токена по refresh-токену."""
+
+    serializer_class = TokenRefreshSerializer
+
+
+class TokenLogoutView(JWTViewMixin, APIView):
+    """Отзыв refresh-токена и access-токена текущего запроса."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = TokenLogoutSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        token_denylist.revoke(serializer.validated_data['refresh'])
+        if isinstance(request.auth, AccessToken):
+            token_denylist.revoke(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -21,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -29,9 +31,13 @@ INSTALLED_APPS = [
     'colorfield',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ServerTimingMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,17 +71,73 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432)
+        }
+    }
+
+# Реплики для чтения: DB_REPLICAS - хосты через пробел (host или
+# host:port), для SQLite - имена файлов. В тестах реплики указывают
+# на тестовую основную базу.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(os.getenv('DB_REPLICAS', '').split(), 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES[alias]['NAME'] = BASE_DIR / replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or 5432)
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает из основной базы; реплики
+# с большим отставанием не используются.
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 10))
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60))
+# Как часто справочники в памяти процесса перечитываются, даже если
+# версия в кэше не менялась (нужно при кэше, не общем для процессов).
+CATALOG_TTL = int(os.getenv('CATALOG_TTL', 5 * 60))
+# Как часто справочники в памяти сверяют свою версию с кэшем.
+CATALOG_VERSION_CHECK_INTERVAL = float(
+    os.getenv('CATALOG_VERSION_CHECK_INTERVAL', 1))
+RECIPE_LIST_CACHE_TIMEOUT = int(os.getenv('RECIPE_LIST_CACHE_TIMEOUT', 5 * 60))
+
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 10))
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 10 * 60))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# Как часто обработчик продлевает аренду выполняемой задачи.
+JOB_HEARTBEAT_INTERVAL = float(
+    os.getenv('JOB_HEARTBEAT_INTERVAL', JOB_TIMEOUT / 3))
+# Сколько хранятся завершенные задачи и их файлы.
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 24 * 60 * 60))
+JOB_CLEANUP_INTERVAL = int(os.getenv('JOB_CLEANUP_INTERVAL', 60 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -125,18 +187,80 @@ AUTH_USER_MODEL = 'users.User'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы пользователей, которые отдает только API после проверки прав.
+PRIVATE_MEDIA_ROOT = os.getenv(
+    'PRIVATE_MEDIA_ROOT', os.path.join(BASE_DIR, 'private'))
+
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 ** 2))
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+# Повторы обработки в пуле потоков; в очереди jobs - JOB_MAX_ATTEMPTS.
+RECIPE_IMAGE_ATTEMPTS = int(os.getenv('RECIPE_IMAGE_ATTEMPTS', 3))
+RECIPE_IMAGE_RETRY_DELAY = float(os.getenv('RECIPE_IMAGE_RETRY_DELAY', 1))
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_SIZES = {
+    'thumbnail': 320,
+    'medium': 960,
+}
+# threads - пул потоков в процессе gunicorn, jobs - очередь run_jobs.
+RECIPE_IMAGE_QUEUE = os.getenv('RECIPE_IMAGE_QUEUE', 'threads')
+
+# Картинки приходят в json как base64, который на треть больше файла.
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 ** 2
+
+# Триграммы используются, только если в базе установлено pg_trgm.
+RECIPE_SEARCH_TRIGRAM = os.getenv(
+    'RECIPE_SEARCH_TRIGRAM', 'True').lower() == 'true'
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Заголовок Server-Timing с временем SQL, сериализации и рендеринга;
+# администратор может запросить профиль запроса через X-Profile: 1.
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Метрики Prometheus на /metrics; для нескольких процессов gunicorn
+# нужна переменная окружения PROMETHEUS_MULTIPROC_DIR.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+# Сколько рецептов или авторов можно передать в одном пакетном запросе.
+RELATION_BATCH_MAX_SIZE = int(os.getenv('RELATION_BATCH_MAX_SIZE', 100))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# JWT без запроса к базе на каждый запрос, рядом с токенами djoser.
+JWT_AUTH = os.getenv('JWT_AUTH', 'False').lower() == 'true'
 
 REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 
 }
 
 DJOSER = {
     'LOGIN_FIELD': 'email'
 }
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_LIFETIME_MINUTES', 5))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_LIFETIME_DAYS', 1))),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'user',
+                    'run_after', 'date_create',)
+    list_filter = ('status', 'name')
+    readonly_fields = ('date_create', 'date_update')
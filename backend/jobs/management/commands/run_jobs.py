@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim, clean_expired, run
+
+
+class Command(BaseCommand):
+    help = 'Обработчик фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Обработчик задач запущен')
+        cleaned = None
+        while True:
+            close_old_connections()
+            if cleaned is None or (time.monotonic() - cleaned
+                                   >= settings.JOB_CLEANUP_INTERVAL):
+                deleted = clean_expired()
+                if deleted:
+                    self.stdout.write(f'Удалено старых задач: {deleted}')
+                cleaned = time.monotonic()
+            job = claim()
+            if job is not None:
+                job = run(job)
+                self.stdout.write(f'{job}')
+                continue
+            if options['once']:
+                break
+            time.sleep(settings.JOB_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS('Очередь пуста'))
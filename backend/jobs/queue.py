@@ -0,0 +1,149 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+CLEANUPS = {}
+
+
+def task(name, cleanup=None):
+    """Регистрирует функцию как фоновую задачу с именем name.
+
+    Функция получает параметры задачи и возвращает результат, который
+    можно сохранить в json. cleanup получает этот результат, когда
+    задача удаляется по истечении JOB_RESULT_TTL, и освобождает то,
+    на что он ссылается.
+    """
+    def decorator(func):
+        TASKS[name] = func
+        if cleanup is not None:
+            CLEANUPS[name] = cleanup
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, user=None):
+    """Ставит задачу в очередь; выполнит ее команда run_jobs."""
+    if name not in TASKS:
+        raise KeyError(f'Неизвестная задача {name}')
+    return Job.objects.create(
+        name=name, payload=payload or {}, user=user,
+        max_attempts=settings.JOB_MAX_ATTEMPTS)
+
+
+def claim():
+    """Забирает следующую готовую к запуску задачу.
+
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько обработчиков не получат одну и ту же задачу. Пока задача
+    выполняется, обработчик продлевает ее date_update (см. Heartbeat);
+    задачи, не продленные дольше JOB_TIMEOUT, считаются брошенными
+    и запускаются снова, пока не исчерпаны попытки. Брошенная задача
+    без попыток (обработчик падал на ней, не успев записать ошибку,
+    например из-за нехватки памяти) помечается как FAILED.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_TIMEOUT)
+    abandoned = Job.objects.filter(status=Job.RUNNING, date_update__lt=stale)
+    exhausted = abandoned.filter(
+        attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, date_update=now,
+            error='Обработчик не завершил задачу за все попытки')
+    if exhausted:
+        logger.error('Задач брошено без оставшихся попыток: %s', exhausted)
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.PENDING, run_after__lte=now)
+            | Q(status=Job.RUNNING, date_update__lt=stale,
+                attempts__lt=F('max_attempts'))
+        ).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.save(update_fields=('status', 'attempts', 'date_update'))
+    return job
+
+
+class Heartbeat(threading.Thread):
+    """Раз в JOB_HEARTBEAT_INTERVAL секунд обновляет date_update
+    выполняемой задачи, чтобы claim не отдал ее другому обработчику."""
+
+    def __init__(self, job):
+        super().__init__(daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                self.beat()
+        finally:
+            connection.close()
+
+    def beat(self):
+        # Если задачу уже забрал другой обработчик, attempts изменился,
+        # и чужую аренду продлевать нельзя.
+        Job.objects.filter(
+            pk=self.job.pk, status=Job.RUNNING, attempts=self.job.attempts
+        ).update(date_update=timezone.now())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job):
+    """Выполняет задачу и сохраняет результат или планирует повтор."""
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = TASKS[job.name](**job.payload)
+    except Exception:
+        logger.exception('Задача %s завершилась с ошибкой', job)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.result = result
+        job.error = ''
+    finally:
+        heartbeat.stop()
+    job.save(update_fields=('status', 'result', 'error', 'run_after',
+                            'date_update'))
+    return job
+
+
+def clean_expired():
+    """Удаляет завершенные задачи старше JOB_RESULT_TTL и то, на что
+    ссылаются их результаты; возвращает число удаленных задач."""
+    expired = Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        date_update__lt=timezone.now() - timedelta(
+            seconds=settings.JOB_RESULT_TTL))
+    for job in expired.filter(name__in=CLEANUPS).only('name', 'result'):
+        try:
+            CLEANUPS[job.name](job.result)
+        except Exception:
+            logger.exception('Не удалось очистить результат задачи %s', job)
+    deleted, _ = expired.delete()
+    return deleted
+
+
+def pending_count():
+    return Job.objects.filter(status=Job.PENDING).count()
@@ -0,0 +1,280 @@
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from api.cache import recipe_list_cache, tags_cache
+from api.catalog import tag_catalog
+from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, Tag)
+
+User = get_user_model()
+
+TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+DEFAULT_INGREDIENTS = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+SEED_IMAGE = 'recipes/images/seed.png'
+# Рецепты равномерно распределены по году до этой даты, чтобы данные
+# не зависели от времени запуска.
+DATE_END = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DATE_SPAN = int(timedelta(days=365).total_seconds())
+
+
+class Batch:
+    """Строки одной таблицы, накопленные по столбцам.
+
+    Когда накоплено batch_size строк, они записываются в базу: в
+    PostgreSQL одной командой COPY, в остальных базах одним executemany.
+    Модели и сигналы Django не используются, поэтому auto_now_add не
+    перезаписывает сгенерированные даты.
+    """
+
+    def __init__(self, command, model, fields):
+        self.command = command
+        self.table = model._meta.db_table
+        self.fields = fields
+        self.columns = [[] for _ in fields]
+        self.written = 0
+        self.elapsed = 0
+
+    def add(self, *values):
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        if len(self.columns[0]) >= self.command.batch_size:
+            self.flush()
+
+    def flush(self):
+        rows = list(zip(*self.columns))
+        if not rows:
+            return
+        started = time.perf_counter()
+        if connection.vendor == 'postgresql':
+            self.copy(rows)
+        else:
+            self.insert(rows)
+        self.elapsed += time.perf_counter() - started
+        self.written += len(rows)
+        self.columns = [[] for _ in self.fields]
+
+    def copy(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH CSV'.format(
+                    self.table, ', '.join(self.fields)), buffer)
+
+    def insert(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+                self.table, ', '.join(self.fields),
+                ', '.join(['%s'] * len(self.fields))), rows)
+
+    def close(self):
+        self.flush()
+        self.command.stdout.write(
+            f'{self.table}: {self.written} строк, запись '
+            f'{self.elapsed:.1f} с')
+        return self.written
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса распределения Ципфа: объект с номером k
+    выбирается с вероятностью, пропорциональной 1 / (k + 1) ** skew."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических данных для нагрузочного тестирования: '
+            'пользователи, рецепты, подписки, избранное и списки покупок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте')
+        parser.add_argument(
+            '--follows', type=float, default=10,
+            help='Среднее число подписок пользователя')
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число рецептов в избранном')
+        parser.add_argument(
+            '--cart', type=float, default=5,
+            help='Среднее число рецептов в списке покупок')
+        parser.add_argument(
+            '--power-users', type=float, default=0.01,
+            help='Доля активных пользователей')
+        parser.add_argument(
+            '--power-factor', type=float, default=30,
+            help='Во сколько раз у активных пользователей больше подписок, '
+                 'избранного и покупок')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности '
+                 'авторов, рецептов и ингредиентов')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument(
+            '--ingredients-file', default=str(
+                DEFAULT_INGREDIENTS if DEFAULT_INGREDIENTS.exists()
+                else 'ingredients.csv'),
+            help='Файл справочника ингредиентов для upload_ingredients')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно не меньше 2 пользователей и 1 рецепта')
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rand = random.Random(options['seed'])
+
+        call_command('upload_ingredients', options['ingredients_file'],
+                     stdout=self.stdout)
+        self.ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        if not self.ingredients:
+            raise CommandError('Справочник ингредиентов пуст')
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in TAGS)
+            # bulk_create не шлет сигналов, поэтому кэши тегов
+            # сбрасываются здесь.
+            tags_cache.bump()
+            tag_catalog.invalidate()
+        self.tags = list(Tag.objects.order_by('pk').values_list(
+            'pk', flat=True))
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.first_user = self.next_id(User)
+            self.first_recipe = self.next_id(Recipe)
+            total = sum((
+                self.seed_users(), self.seed_recipes(),
+                self.seed_relations()))
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [User, Recipe]):
+                    cursor.execute(sql)
+        recipe_list_cache.bump()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {total} строк за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} строк/с); активные пользователи: '
+            f'id {self.first_user}..{self.first_user + self.power_count - 1}'
+        ))
+
+    def date(self, value):
+        """Дата в виде, в котором ее хранит текущая база."""
+        if connection.vendor == 'postgresql':
+            return value
+        return connection.ops.adapt_datetimefield_value(value)
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def count(self, mean):
+        """Случайное число объектов с длинным хвостом вокруг mean."""
+        return int(self.rand.expovariate(1 / mean)) if mean > 0 else 0
+
+    def sample(self, count, cum_weights, limit):
+        """До count разных номеров из range(len(cum_weights)) с учетом
+        популярности; повторы отбрасываются."""
+        if count <= 0:
+            return set()
+        return set(self.rand.choices(
+            range(len(cum_weights)), cum_weights=cum_weights,
+            k=min(count, limit)))
+
+    def seed_users(self):
+        users = self.options['users']
+        # Активные пользователи - первые по id, чтобы их было легко найти.
+        self.power_count = max(1, int(users * self.options['power_users']))
+        batch = Batch(self, User, (
+            'id', 'password', 'is_superuser', 'username', 'first_name',
+            'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+            'role'))
+        date_joined = self.date(DATE_END)
+        for number in range(users):
+            pk = self.first_user + number
+            batch.add(pk, '!', False, f'seed{pk}', f'Имя{number}',
+                      f'Фамилия{number}', f'seed{pk}@foodgram.test', False,
+                      True, date_joined, User.USER)
+        return batch.close()
+
+    def seed_recipes(self):
+        options = self.options
+        rand = self.rand
+        author_weights = zipf_weights(options['users'], options['skew'])
+        ingredient_weights = zipf_weights(
+            len(self.ingredients), options['skew'])
+        recipes = Batch(self, Recipe, (
+            'id', 'name', 'author_id', 'image', 'image_variants', 'text',
+            'cooking_time', 'date_create'))
+        amounts = Batch(self, IngredientAmount, (
+            'recipe_id', 'ingredient_id', 'amount'))
+        tags = Batch(self, Recipe.tags.through, ('recipe_id', 'tag_id'))
+
+        for start in range(0, options['recipes'], self.batch_size):
+            count = min(self.batch_size, options['recipes'] - start)
+            # Авторы выбираются сразу для всей пачки: популярные авторы
+            # публикуют большую часть рецептов.
+            authors = rand.choices(
+                range(options['users']), cum_weights=author_weights, k=count)
+            for number, author in enumerate(authors, start):
+                pk = self.first_recipe + number
+                recipes.add(
+                    pk, f'Рецепт {number}', self.first_user + author,
+                    SEED_IMAGE, '{}', f'Описание рецепта {number}',
+                    rand.randint(1, 180),
+                    self.date(DATE_END - timedelta(
+                        seconds=rand.randrange(DATE_SPAN))))
+                for index in self.sample(
+                        max(1, self.count(
+                            options['ingredients_per_recipe'])),
+                        ingredient_weights, len(self.ingredients)):
+                    amounts.add(pk, self.ingredients[index],
+                                rand.randint(1, 500))
+                for tag in rand.sample(
+                        self.tags, rand.randint(1, len(self.tags))):
+                    tags.add(pk, tag)
+        return recipes.close() + amounts.close() + tags.close()
+
+    def seed_relations(self):
+        options = self.options
+        author_weights = zipf_weights(options['users'], options['skew'])
+        recipe_weights = zipf_weights(options['recipes'], options['skew'])
+        follows = Batch(self, Follow, ('user_id', 'author_id'))
+        favorites = Batch(self, Favorite, ('user_id', 'recipe_id'))
+        carts = Batch(self, ShoppingCart, ('user_id', 'recipe_id'))
+
+        for number in range(options['users']):
+            user = self.first_user + number
+            factor = (options['power_factor']
+                      if number < self.power_count else 1)
+            for author in self.sample(
+                    self.count(options['follows'] * factor),
+                    author_weights, options['users'] - 1):
+                if author != number:
+                    follows.add(user, self.first_user + author)
+            for batch, mean in ((favorites, options['favorites']),
+                                (carts, options['cart'])):
+                for recipe in self.sample(
+                        self.count(mean * factor), recipe_weights,
+                        options['recipes']):
+                    batch.add(user, self.first_recipe + recipe)
+        return follows.close() + favorites.close() + carts.close()
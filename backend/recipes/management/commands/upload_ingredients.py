@@ -1,35 +1,157 @@
+import csv
+import json
 import os
-from csv import DictReader
+import tempfile
+from itertools import islice
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import ingredients_cache
+from api.search import ingredient_index
 from recipes.models import Ingredient
 from foodgram_backend.settings import STATIC_ROOT
 
+JSON_CHUNK_SIZE = 64 * 1024
+MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def normalize(value):
+    """Убирает лишние пробелы и приводит строку к нижнему регистру."""
+    return ' '.join(str(value).split()).lower()
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row[:2] if len(row) >= 2 else None
+
+
+def read_json(file):
+    """Читает массив объектов json по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается массив объектов json')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный json')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if isinstance(item, dict):
+            yield [item.get('name'), item.get('measurement_unit')]
+        else:
+            yield None
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из csv-файла'
+    help = 'Загрузка ингредиентов из csv- или json-файла'
 
     def add_arguments(self, parser):
-        parser.add_argument("file_name", type=str)
+        parser.add_argument(
+            "file_name", type=str,
+            help='Путь к файлу или имя файла в static/data')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки строк')
 
     def handle(self, *args, **options):
-        file_path = os.path.join(
-            STATIC_ROOT, 'data/', options['file_name'])
-
-        self.stdout.write('Загрузка csv-файла')
-        with open(file_path, 'r', encoding='utf-8') as csv_file:
-            csv_data = DictReader(csv_file, ['name', 'measurement_unit'])
-            ingredients = []
-            for row in csv_data:
-
-                ingredient = Ingredient(
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit']
-                )
-                ingredients.append(ingredient)
-
-            Ingredient.objects.bulk_create(ingredients)
-            self.stdout.write(
-                self.style.SUCCESS('Загрузка завершена')
-            )
+        file_path = options['file_name']
+        if not os.path.isabs(file_path) and not os.path.exists(file_path):
+            file_path = os.path.join(STATIC_ROOT, 'data/', file_path)
+        file_format = (options['format']
+                       or os.path.splitext(file_path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла {file_path}')
+        if not os.path.exists(file_path):
+            raise CommandError(f'Файл {file_path} не найден')
+        self.batch_size = options['batch_size']
+        self.read = self.invalid = 0
+
+        self.stdout.write(f'Загрузка {file_format}-файла {file_path}')
+        before = Ingredient.objects.count()
+        with open(file_path, 'r', encoding='utf-8') as file:
+            rows = self.clean(READERS[file_format](file))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    distinct = self.copy(rows)
+                else:
+                    distinct = self.insert(rows)
+        created = Ingredient.objects.count() - before
+        ingredients_cache.bump()
+        ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка завершена: прочитано {self.read}, '
+            f'добавлено {created}, уже были {distinct - created}, '
+            f'повторов в файле {self.read - distinct}, '
+            f'пропущено некорректных {self.invalid}'))
+
+    def clean(self, rows):
+        for row in rows:
+            name, unit = (normalize(value) if value is not None else ''
+                          for value in row or (None, None))
+            if (not name or not unit
+                    or max(len(name), len(unit)) > MAX_LENGTH):
+                self.invalid += 1
+                continue
+            self.read += 1
+            if self.read % self.batch_size == 0:
+                self.stdout.write(f'Прочитано строк: {self.read}')
+            yield name, unit
+
+    def insert(self, rows):
+        """Вставляет пачками, пропуская уже существующие ингредиенты,
+        и возвращает число различных строк файла."""
+        rows = iter(rows)
+        seen = set()
+        while True:
+            batch = set(islice(rows, self.batch_size))
+            if not batch:
+                break
+            batch -= seen
+            seen |= batch
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch),
+                ignore_conflicts=True)
+        return len(seen)
+
+    def copy(self, rows):
+        """Загружает строки через COPY во временную таблицу, переносит
+        новые одним INSERT ... ON CONFLICT DO NOTHING и возвращает число
+        различных строк файла."""
+        table = Ingredient._meta.db_table
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as buffer:
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE TEMP TABLE ingredient_import '
+                    '(name varchar(200), measurement_unit varchar(200))')
+                cursor.cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH CSV', buffer)
+                cursor.execute(
+                    'SELECT count(*) FROM (SELECT DISTINCT name, '
+                    'measurement_unit FROM ingredient_import) AS rows')
+                [distinct] = cursor.fetchone()
+                cursor.execute(
+                    f'INSERT INTO {table} (name, measurement_unit) '
+                    'SELECT DISTINCT name, measurement_unit '
+                    'FROM ingredient_import '
+                    'ON CONFLICT (name, measurement_unit) DO NOTHING')
+                cursor.execute('DROP TABLE ingredient_import')
+        return distinct
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+SEARCH_INDEX = (
+    "CREATE INDEX IF NOT EXISTS recipe_search_idx ON recipes_recipe "
+    "USING gin (to_tsvector('russian'::regconfig, "
+    "COALESCE(name, '') || ' ' || COALESCE(text, '')))"
+)
+TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx ON recipes_recipe "
+    "USING gin (name gin_trgm_ops)"
+)
+
+
+def create_indexes(apps, schema_editor):
+    """Создает GIN-индексы для полнотекстового и триграммного поиска.
+
+    Индексы есть только в PostgreSQL; триграммный индекс создается,
+    если на сервере доступно расширение pg_trgm.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SEARCH_INDEX)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(TRIGRAM_INDEX)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_ingredient_unique_name_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
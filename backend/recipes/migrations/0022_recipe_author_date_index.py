@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-date_create', '-id'], name='recipe_author_date_idx'),
+        ),
+    ]
@@ -81,6 +81,11 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-date_create',)
+        indexes = [
+            # Последние рецепты автора для подписок.
+            models.Index(fields=['author', '-date_create', '-id'],
+                         name='recipe_author_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -101,6 +106,11 @@ class Recipe(models.Model):
         blank=False,
         verbose_name='Картинка'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии картинки'
+    )
     text = models.TextField(blank=False, verbose_name='Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -0,0 +1,130 @@
+"""Генерация реалистичного набора данных для тестов производительности."""
+import os
+import random
+from csv import DictReader
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from recipes.models import (Tag, Ingredient, Recipe, IngredientAmount,
+                            Follow, Favorite, ShoppingCart)
+
+User = get_user_model()
+
+SEED_USERS = int(os.getenv('BENCH_USERS', 2000))
+SEED_RECIPES = int(os.getenv('BENCH_RECIPES', 3000))
+SEED = int(os.getenv('BENCH_SEED', 42))
+
+POWER_USER_FOLLOWS = 30
+POWER_USER_CART = 60
+POWER_USER_FAVORITES = 60
+
+TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAAB'
+         'ieywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAA'
+         'AACklEQVQImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg==')
+
+
+def bulk_create(model, objs):
+    """Создает объекты пачкой и возвращает их с первичными ключами.
+
+    SQLite в Django 3.2 не возвращает id из bulk_create, поэтому объекты
+    перечитываются из базы, которая к этому моменту пуста.
+    """
+    model.objects.bulk_create(objs, batch_size=1000)
+    return list(model.objects.order_by('pk'))
+
+
+def load_ingredients():
+    """Загружает справочник ингредиентов из csv-файла проекта."""
+    file_path = os.path.join(settings.STATIC_ROOT, 'data/ingredients.csv')
+    with open(file_path, 'r', encoding='utf-8') as csv_file:
+        csv_data = DictReader(csv_file, ['name', 'measurement_unit'])
+        return bulk_create(Ingredient, [
+            Ingredient(name=row['name'],
+                       measurement_unit=row['measurement_unit'])
+            for row in csv_data
+        ])
+
+
+def seed_dataset(users=SEED_USERS, recipes=SEED_RECIPES, seed=SEED):
+    """Заполняет базу пользователями, рецептами, подписками, избранным
+    и списками покупок с перекосом в сторону популярных авторов."""
+    rnd = random.Random(seed)
+    tags = bulk_create(Tag, [
+        Tag(name=name, slug=slug, color=color)
+        for name, slug, color in TAGS])
+    ingredients = load_ingredients()
+    user_list = bulk_create(User, [
+        User(username=f'user{i}', email=f'user{i}@foodgram.test',
+             first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+             password='!')
+        for i in range(users)
+    ])
+    power_user = user_list[0]
+
+    # Небольшая доля авторов публикует большую часть рецептов.
+    author_weights = [1 / (rank + 1) for rank in range(len(user_list))]
+    authors = rnd.choices(user_list, weights=author_weights, k=recipes)
+    Recipe.objects.bulk_create([
+        Recipe(name=f'Рецепт {i}', author=author,
+               image='recipes/images/seed.png', text=f'Описание {i}',
+               cooking_time=rnd.randint(5, 180))
+        for i, author in enumerate(authors)
+    ], batch_size=1000)
+    recipe_list = list(Recipe.objects.order_by('pk'))
+
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(recipe=recipe, ingredient=ingredient,
+                         amount=rnd.randint(1, 500))
+        for recipe in recipe_list
+        for ingredient in rnd.sample(ingredients, rnd.randint(3, 10))
+    )
+    recipe_tags = Recipe.tags.through
+    recipe_tags.objects.bulk_create(
+        recipe_tags(recipe=recipe, tag=tag)
+        for recipe in recipe_list
+        for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+    )
+
+    follows, favorites, carts = set(), set(), set()
+    for user in user_list[1:]:
+        for author in rnd.choices(user_list, weights=author_weights, k=3):
+            if author != user:
+                follows.add((user.id, author.id))
+        for recipe in rnd.sample(recipe_list, 3):
+            favorites.add((user.id, recipe.id))
+        for recipe in rnd.sample(recipe_list, 2):
+            carts.add((user.id, recipe.id))
+    for author in user_list[1:POWER_USER_FOLLOWS + 1]:
+        follows.add((power_user.id, author.id))
+    for recipe in rnd.sample(
+            recipe_list, min(POWER_USER_FAVORITES, len(recipe_list))):
+        favorites.add((power_user.id, recipe.id))
+    for recipe in rnd.sample(
+            recipe_list, min(POWER_USER_CART, len(recipe_list))):
+        carts.add((power_user.id, recipe.id))
+
+    Follow.objects.bulk_create(
+        Follow(user_id=user, author_id=author) for user, author in follows)
+    Favorite.objects.bulk_create(
+        Favorite(user_id=user, recipe_id=recipe)
+        for user, recipe in favorites)
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user_id=user, recipe_id=recipe)
+        for user, recipe in carts)
+
+    return SimpleNamespace(
+        tags=tags,
+        ingredients=ingredients,
+        users=user_list,
+        recipes=recipe_list,
+        power_user=power_user,
+        author=authors[0],
+    )
@@ -0,0 +1,246 @@
+"""Проверка количества SQL-запросов и времени ответа эндпоинтов API.
+
+Тесты заполняют базу реалистичным набором данных и ограничивают сверху
+число запросов на каждый эндпоинт. Для списков дополнительно проверяется,
+что число запросов не зависит от размера страницы, что ловит N+1.
+
+Время ответа выводится в конце прогона, а при заданной переменной
+окружения BENCH_OUTPUT сохраняется в json-файл.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.catalog import ingredient_catalog, tag_catalog
+from api.search import ingredient_index
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+from .fixtures import IMAGE, seed_dataset
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+TIMINGS = []
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    if not TIMINGS:
+        return
+    sys.stderr.write('\n{:<45} {:>8} {:>10}\n'.format(
+        'endpoint', 'queries', 'ms'))
+    for row in TIMINGS:
+        sys.stderr.write('{name:<45} {queries:>8} {ms:>10.2f}\n'.format(
+            **row))
+    output = os.getenv('BENCH_OUTPUT')
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(TIMINGS, file, ensure_ascii=False, indent=2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ApiQueriesTest(TestCase):
+    """Ограничения на число запросов для каждого маршрута api/urls.py."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset()
+        ingredient_index.invalidate()
+        cls.user = cls.data.power_user
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipe = cls.data.recipes[0]
+        cls.other_author = cls.data.users[-1]
+
+    def setUp(self):
+        cache.clear()
+        # Справочники в памяти процесса в работе всегда прогреты.
+        ingredient_catalog.objects(refresh=True)
+        tag_catalog.objects(refresh=True)
+        self.anon = APIClient()
+        self.auth = APIClient()
+        self.auth.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, name, max_queries, client, method, url, data=None,
+                status_code=200):
+        """Выполняет запрос, проверяет статус и число SQL-запросов."""
+        with CaptureQueriesContext(connection) as context:
+            start = perf_counter()
+            response = getattr(client, method)(url, data, format='json')
+            response.body = (b''.join(response.streaming_content)
+                             if response.streaming else response.content)
+            elapsed = perf_counter() - start
+        TIMINGS.append({'name': name, 'queries': len(context),
+                        'ms': elapsed * 1000})
+        self.assertEqual(response.status_code, status_code,
+                         response.body[:500])
+        self.assertLessEqual(
+            len(context), max_queries,
+            f'{name}: {len(context)} запросов при лимите {max_queries}:\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries))
+        return response
+
+    def assertConstantQueries(self, name, client, url):
+        """Проверяет, что число запросов не растет вместе со страницей.
+
+        Первый запрос прогревает кэши справочников и не учитывается;
+        его размер страницы не совпадает с проверяемыми, чтобы проверка
+        не попала в кэш страниц.
+        """
+        client.get(url, {'limit': 2})
+        counts = []
+        for limit in (1, 25):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1],
+                         f'{name}: число запросов зависит от размера '
+                         f'страницы: {counts}')
+
+    def recipe_payload(self):
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.data.ingredients[:5]],
+            'tags': [tag.id for tag in self.data.tags[:2]],
+            'image': IMAGE,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+
+    def test_recipes_list(self):
+        self.request('recipes list anon', 5, self.anon, 'get',
+                     '/api/recipes/')
+        self.request('recipes list auth', 6, self.auth, 'get',
+                     '/api/recipes/')
+        response = self.request('recipes list tags', 6, self.auth, 'get',
+                                '/api/recipes/?tags=breakfast&tags=lunch')
+        self.assertEqual(response.json()['count'], Recipe.objects.filter(
+            tags__slug__in=['breakfast', 'lunch']).distinct().count())
+        self.request('recipes list favorited', 6, self.auth, 'get',
+                     '/api/recipes/?is_favorited=1')
+        self.request('recipes list in cart', 6, self.auth, 'get',
+                     '/api/recipes/?is_in_shopping_cart=1')
+        self.request('recipes list author', 6, self.auth, 'get',
+                     f'/api/recipes/?author={self.data.author.id}')
+
+    def test_recipes_list_no_n_plus_one(self):
+        self.assertConstantQueries('recipes anon', self.anon,
+                                   '/api/recipes/')
+        self.assertConstantQueries('recipes auth', self.auth,
+                                   '/api/recipes/')
+
+    def test_recipe_detail(self):
+        self.request('recipe detail anon', 4, self.anon, 'get',
+                     f'/api/recipes/{self.recipe.id}/')
+        self.request('recipe detail auth', 5, self.auth, 'get',
+                     f'/api/recipes/{self.recipe.id}/')
+
+    def test_recipe_create_update_delete(self):
+        response = self.request('recipe create', 13, self.auth, 'post',
+                                '/api/recipes/', self.recipe_payload(),
+                                status_code=201)
+        url = f'/api/recipes/{response.json()["id"]}/'
+        # Один из запросов - блокировка строки рецепта на время правки.
+        self.request('recipe update', 11, self.auth, 'patch', url,
+                     self.recipe_payload())
+        self.request('recipe delete', 12, self.auth, 'delete', url,
+                     status_code=204)
+
+    def test_favorite(self):
+        recipe = Recipe.objects.exclude(favorite_user__user=self.user).first()
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.request('favorite add', 3, self.auth, 'post', url,
+                     status_code=201)
+        self.request('favorite add twice', 3, self.auth, 'post', url,
+                     status_code=400)
+        self.request('favorite delete', 2, self.auth, 'delete', url,
+                     status_code=204)
+        self.assertFalse(
+            Favorite.objects.filter(user=self.user, recipe=recipe).exists())
+
+    def test_shopping_cart(self):
+        recipe = Recipe.objects.exclude(cart_user__user=self.user).first()
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        self.request('shopping_cart add', 3, self.auth, 'post', url,
+                     status_code=201)
+        self.request('shopping_cart delete', 2, self.auth, 'delete', url,
+                     status_code=204)
+        self.assertFalse(
+            ShoppingCart.objects.filter(
+                user=self.user, recipe=recipe).exists())
+
+    def test_download_shopping_cart(self):
+        url = '/api/recipes/download_shopping_cart/'
+        response = self.request('download_shopping_cart', 2, self.auth,
+                                'get', url)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertTrue(response.body.decode().startswith(
+            'Ваш список покупок'))
+        for file_format, content_type in (('csv', 'text/csv'),
+                                          ('pdf', 'application/pdf')):
+            response = self.request(f'download_shopping_cart {file_format}',
+                                    2, self.auth, 'get',
+                                    f'{url}?format={file_format}')
+            self.assertTrue(response['Content-Type'].startswith(content_type))
+            self.assertIn(f'shopping_list.{file_format}',
+                          response['Content-Disposition'])
+
+    def test_users(self):
+        self.request('users list anon', 2, self.anon, 'get', '/api/users/')
+        self.request('users list auth', 3, self.auth, 'get', '/api/users/')
+        self.request('user detail', 2, self.auth, 'get',
+                     f'/api/users/{self.other_author.id}/')
+        self.request('users me', 2, self.auth, 'get', '/api/users/me/')
+        self.assertConstantQueries('users', self.auth, '/api/users/')
+
+    def test_user_create(self):
+        self.request('user create', 4, self.anon, 'post', '/api/users/', {
+            'email': 'new@foodgram.test', 'username': 'new_user',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'Sup3r-secret'}, status_code=201)
+
+    def test_subscriptions(self):
+        response = self.request('subscriptions', 5, self.auth, 'get',
+                                '/api/users/subscriptions/?recipes_limit=3')
+        for author in response.json()['results']:
+            latest = list(Recipe.objects.filter(
+                author_id=author['id']).order_by(
+                    '-date_create', '-pk').values_list('pk', flat=True)[:3])
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']], latest)
+            self.assertEqual(
+                author['recipes_count'],
+                Recipe.objects.filter(author_id=author['id']).count())
+        self.assertConstantQueries('subscriptions', self.auth,
+                                   '/api/users/subscriptions/')
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.other_author.id}/subscribe/'
+        Follow.objects.filter(user=self.user,
+                              author=self.other_author).delete()
+        self.request('subscribe', 4, self.auth, 'post', url,
+                     status_code=201)
+        self.request('unsubscribe', 2, self.auth, 'delete', url,
+                     status_code=204)
+
+    def test_tags(self):
+        self.request('tags list', 1, self.anon, 'get', '/api/tags/')
+        self.request('tag detail', 1, self.anon, 'get',
+                     f'/api/tags/{self.data.tags[0].id}/')
+
+    def test_ingredients(self):
+        self.request('ingredients search', 1, self.anon, 'get',
+                     '/api/ingredients/?name=абр')
+        self.request('ingredient detail', 1, self.anon, 'get',
+                     f'/api/ingredients/{self.data.ingredients[0].id}/')
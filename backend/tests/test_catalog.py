@@ -0,0 +1,77 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from api.catalog import ingredient_catalog, tag_catalog
+from recipes.models import Ingredient, Tag
+
+
+class CatalogTest(TestCase):
+    """Справочники ингредиентов и тегов в памяти процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+
+    def setUp(self):
+        cache.clear()
+        ingredient_catalog.invalidate()
+        tag_catalog.invalidate()
+
+    def test_lookup_does_not_query_when_warm(self):
+        ingredient_catalog.objects()
+        with self.assertNumQueries(0):
+            salt = ingredient_catalog.get(self.salt.id)
+            self.assertEqual(
+                (salt.name, salt.measurement_unit), ('соль', 'г'))
+            self.assertEqual(
+                ingredient_catalog.missing([self.salt.id, str(self.salt.id)]),
+                [])
+
+    def test_missing_ids_are_rechecked_once(self):
+        tag_catalog.objects()
+        with self.assertNumQueries(1) as context:
+            self.assertEqual(
+                tag_catalog.missing([self.tag.id, 0, 'x', 10 ** 6]),
+                [0, 'x', 10 ** 6])
+        self.assertIn('WHERE', context.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            self.assertEqual(tag_catalog.missing([0, 'x', 10 ** 30]),
+                             [0, 'x', 10 ** 30])
+
+    def test_unknown_id_does_not_reload_catalog(self):
+        ingredient_catalog.objects()
+        with self.assertNumQueries(1) as context:
+            self.assertIsNone(ingredient_catalog.get(10 ** 6))
+        self.assertIn('WHERE', context.captured_queries[0]['sql'])
+
+    def test_version_is_checked_once_per_interval(self):
+        ingredient_catalog.objects()
+        with mock.patch.object(ingredient_catalog, 'check_interval', 60), \
+                mock.patch.object(ingredient_catalog.catalog_cache,
+                                  'version') as version:
+            for _ in range(10):
+                ingredient_catalog.get(self.salt.id)
+        version.assert_not_called()
+
+    def test_new_object_is_found_without_version_change(self):
+        ingredient_catalog.objects()
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='перец', measurement_unit='г')])
+        pepper = Ingredient.objects.get(name='перец')
+        self.assertEqual(ingredient_catalog.get(pepper.id).name, 'перец')
+
+    def test_change_bumps_version(self):
+        ingredient_catalog.objects()
+        self.salt.measurement_unit = 'кг'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.save()
+        self.assertEqual(
+            ingredient_catalog.get(self.salt.id).measurement_unit, 'кг')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.delete()
+        self.assertIsNone(ingredient_catalog.get(self.salt.id))
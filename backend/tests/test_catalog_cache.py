@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils.http import parse_http_date
+from rest_framework.test import APIClient
+
+from api.cache import tags_cache
+from api.checks import shared_cache_check
+from recipes.models import Ingredient, Tag
+
+
+class CatalogCacheTest(TestCase):
+    """Кэширование и условные GET для справочников."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_cache_hit_does_not_query_database(self):
+        for url in ('/api/tags/', f'/api/tags/{self.tag.id}/',
+                    '/api/ingredients/'):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_not_modified(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+        self.assertEqual(self.client.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        ).status_code, 304)
+
+    def test_change_bumps_version(self):
+        response = self.client.get('/api/tags/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        changed = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(len(changed.json()), 2)
+
+    def test_changes_within_one_second(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(parse_http_date(response['Last-Modified']),
+                         tags_cache.version())
+        for number in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.create(name=f'Тег {number}',
+                                   slug=f'tag-{number}',
+                                   color=f'#00000{number}')
+            changed = self.client.get(
+                '/api/tags/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertGreater(parse_http_date(changed['Last-Modified']),
+                               parse_http_date(response['Last-Modified']))
+            response = changed
+
+    def test_local_cache_warning(self):
+        self.assertEqual(
+            [warning.id for warning in shared_cache_check(None)],
+            ['api.W001'])
+
+    def test_missing_object_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/tags/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/tags/0/').status_code, 404)
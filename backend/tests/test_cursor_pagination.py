@@ -0,0 +1,58 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Follow
+from .fixtures import seed_dataset
+
+
+class CursorPaginationTest(TestCase):
+    """Режим курсора для списка рецептов и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset(users=50, recipes=40)
+        cls.user = cls.data.power_user
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        """Проходит все страницы по ссылкам next и собирает id."""
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(*)' in query['sql']
+                                 for query in context.captured_queries))
+            page = response.json()
+            self.assertEqual(list(page),
+                             ['count', 'next', 'previous', 'results'])
+            self.assertIsNone(page['count'])
+            ids += [item['id'] for item in page['results']]
+            url = page['next']
+        return ids
+
+    def test_recipes(self):
+        ids = self.walk('/api/recipes/?pagination=cursor&limit=7')
+        expected = self.client.get('/api/recipes/?limit=100').json()
+        self.assertEqual(ids, [item['id'] for item in expected['results']])
+
+    def test_recipes_with_tags(self):
+        ids = self.walk('/api/recipes/?pagination=cursor&tags=lunch')
+        expected = self.client.get('/api/recipes/?limit=100&tags=lunch')
+        self.assertEqual(
+            ids, [item['id'] for item in expected.json()['results']])
+
+    def test_subscriptions(self):
+        ids = self.walk('/api/users/subscriptions/?pagination=cursor')
+        self.assertEqual(ids, list(
+            Follow.objects.filter(user=self.user).order_by(
+                'author__username').values_list('author_id', flat=True)))
+
+    def test_page_number_mode_is_default(self):
+        page = self.client.get('/api/recipes/').json()
+        self.assertEqual(page['count'], 40)
@@ -0,0 +1,96 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.catalog import ingredient_catalog, tag_catalog
+from api.flat import recipe_rows, represent_recipes
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+from .fixtures import seed_dataset
+
+
+class AuthorOnly(BasePermission):
+    """Пускает к рецепту только его автора."""
+
+    def has_object_permission(self, request, view, obj):
+        return obj.author == request.user
+
+
+class FlatRecipesTest(TestCase):
+    """Быстрое представление рецептов совпадает с RecipeSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_dataset(users=60, recipes=80)
+        Recipe.objects.filter(pk=cls.data.recipes[0].pk).update(
+            image_variants={'thumbnail': 'recipes/images/variants/1.jpg'})
+
+    def setUp(self):
+        cache.clear()
+        ingredient_catalog.objects(refresh=True)
+        tag_catalog.objects(refresh=True)
+
+    def queryset(self, user):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = user
+        return RecipeViewSet(
+            request=request, format_kwarg=None).get_queryset()
+
+    def assertSameJSON(self, user):
+        queryset = self.queryset(user)
+        expected = RecipeSerializer(
+            queryset, many=True, context={'user': user}).data
+        actual = represent_recipes(list(recipe_rows(queryset)))
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            self.assertEqual(renderer.render(actual),
+                             renderer.render(expected))
+
+    def test_parity_anonymous(self):
+        self.assertSameJSON(AnonymousUser())
+
+    def test_parity_power_user(self):
+        self.assertSameJSON(self.data.power_user)
+
+    def test_endpoints_match_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.data.power_user)
+        recipe = self.data.recipes[0]
+        response = client.get(f'/api/recipes/{recipe.id}/')
+        expected = RecipeSerializer(
+            self.queryset(self.data.power_user).get(pk=recipe.pk),
+            context={'user': self.data.power_user}).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+        self.assertEqual(client.get('/api/recipes/0/').status_code, 404)
+        self.assertEqual(client.get('/api/recipes/x/').status_code, 404)
+
+        response = client.get('/api/recipes/', {'limit': 10})
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertEqual(response.json()['count'], len(self.data.recipes))
+
+    def test_retrieve_checks_permissions_on_recipe(self):
+        recipe = next(recipe for recipe in self.data.recipes
+                      if recipe.author_id != self.data.power_user.id)
+        client = APIClient()
+        client.force_authenticate(recipe.author)
+        url = f'/api/recipes/{recipe.id}/'
+        with patch.object(RecipeViewSet, 'permission_classes',
+                          (AuthorOnly,)):
+            self.assertEqual(client.get(url).status_code, 200)
+            client.force_authenticate(self.data.power_user)
+            self.assertEqual(client.get(url).status_code, 403)
+
+    def test_page_queries_do_not_grow(self):
+        rows = recipe_rows(self.queryset(AnonymousUser()))
+        represent_recipes(list(rows[:1]))
+        with CaptureQueriesContext(connection) as context:
+            represent_recipes(list(rows))
+        self.assertEqual(len(context), 3)
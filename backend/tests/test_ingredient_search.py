@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.cache import ingredients_cache
+from api.search import IngredientIndex, ingredient_index, normalize
+from recipes.models import Ingredient
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'сливочное масло', 'масло растительное', 'Мёд',
+                'медовый торт', 'соль', 'масляный крем'))
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.invalidate()
+        self.client = APIClient()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_go_first(self):
+        self.assertEqual(
+            self.search('МАСЛ'),
+            ['масло растительное', 'масляный крем', 'сливочное масло'])
+
+    def test_yo_is_normalised(self):
+        self.assertEqual(self.search('мед'), ['Мёд', 'медовый торт'])
+        self.assertEqual(self.search('мёдо'), ['медовый торт'])
+
+    def test_search_does_not_query_database_when_warm(self):
+        self.search('соль')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('соль'), ['соль'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_results_are_capped(self):
+        self.assertEqual(len(self.search('м')), 2)
+
+    def test_index_is_refreshed_on_change(self):
+        self.assertEqual(self.search('перец'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='перец', measurement_unit='г')
+        self.assertEqual(self.search('перец'), ['перец'])
+
+    def test_list_without_search_and_detail(self):
+        self.assertEqual(
+            len(self.client.get('/api/ingredients/').json()), 6)
+        ingredient = Ingredient.objects.get(name='соль')
+        response = self.client.get(
+            f'/api/ingredients/{ingredient.id}/', {'name': 'масло'})
+        self.assertEqual(response.json()['name'], 'соль')
+
+    def test_change_in_other_process_is_noticed(self):
+        index = IngredientIndex(ingredients_cache, ttl=300, check_interval=0)
+        self.assertEqual(index.search('перец', 1), [])
+        # Другой процесс добавил ингредиент и сменил версию, а сигналы
+        # этого процесса индекс не сбрасывали.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='перец', measurement_unit='г')])
+        self.assertEqual(index.search('перец', 1), [])
+        ingredients_cache.bump()
+        self.assertEqual(
+            [item.name for item in index.search('перец', 1)], ['перец'])
+
+    def test_invalidate_during_search_and_build(self):
+        index = IngredientIndex(ingredients_cache, ttl=60, check_interval=0)
+        index.search('соль', 1)
+
+        def invalidate_then_normalize(value):
+            index.invalidate()
+            return normalize(value)
+
+        # Сброс индекса посреди поиска не ломает уже взятый снимок.
+        with mock.patch('api.search.normalize',
+                        side_effect=invalidate_then_normalize):
+            found = index.search('соль', 1)
+        self.assertEqual([item.name for item in found], ['соль'])
+
+        # Индекс, сброшенный во время построения, отвечает на этот
+        # поиск, но не сохраняется.
+        with mock.patch('api.search.normalize',
+                        side_effect=invalidate_then_normalize):
+            found = index.search('соль', 1)
+        self.assertEqual([item.name for item in found], ['соль'])
+        self.assertIsNone(index._snapshot)
+        index.search('соль', 1)
+        self.assertIsNotNone(index._snapshot)
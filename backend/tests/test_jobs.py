@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.tasks import private_storage
+from jobs.models import Job
+from jobs.queue import Heartbeat, claim, clean_expired, enqueue, run, task
+from recipes.models import (Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart)
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PRIVATE_MEDIA_ROOT = tempfile.mkdtemp()
+CALLS = []
+
+
+@task('test_flaky')
+def flaky(fail_times):
+    CALLS.append(fail_times)
+    if len(CALLS) <= fail_times:
+        raise RuntimeError('сбой')
+    return {'calls': len(CALLS)}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,
+                   PRIVATE_MEDIA_ROOT=PRIVATE_MEDIA_ROOT, JOB_RETRY_DELAY=0)
+class JobQueueTest(TestCase):
+    """Очередь фоновых задач в базе данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@foodgram.test')
+        cls.other = User.objects.create(
+            username='other', email='other@foodgram.test')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes/images/test.png')
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=7)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(PRIVATE_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        CALLS.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_jobs(self):
+        # Обработчик закрывает устаревшие соединения, а в TestCase это
+        # оборвало бы транзакцию теста.
+        with mock.patch('jobs.management.commands.run_jobs.'
+                        'close_old_connections'):
+            call_command('run_jobs', '--once', stdout=StringIO())
+
+    def run_failing_jobs(self):
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.run_jobs()
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(KeyError):
+            enqueue('missing')
+
+    def test_job_is_retried_until_success(self):
+        job = enqueue('test_flaky', {'fail_times': 1})
+        self.run_failing_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.result, {'calls': 2})
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue('test_flaky', {'fail_times': 5})
+        self.run_failing_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('RuntimeError', job.error)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        enqueue('test_flaky', {'fail_times': 0})
+        job = claim()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertIsNone(claim())
+        self.assertEqual(run(job).status, Job.DONE)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_heartbeat_keeps_job_claimed(self):
+        enqueue('test_flaky', {'fail_times': 0})
+        job = claim()
+        long_ago = timezone.now() - timedelta(seconds=120)
+        Job.objects.filter(pk=job.pk).update(date_update=long_ago)
+        Heartbeat(job).beat()
+        self.assertIsNone(claim())
+
+        Job.objects.filter(pk=job.pk).update(date_update=long_ago)
+        reclaimed = claim()
+        self.assertEqual(reclaimed.attempts, 2)
+        # Старый обработчик больше не продлевает задачу.
+        Job.objects.filter(pk=job.pk).update(date_update=long_ago)
+        Heartbeat(job).beat()
+        self.assertEqual(Job.objects.get(pk=job.pk).date_update, long_ago)
+
+    @override_settings(JOB_TIMEOUT=60, JOB_MAX_ATTEMPTS=2)
+    def test_abandoned_job_fails_after_max_attempts(self):
+        enqueue('test_flaky', {'fail_times': 0})
+        long_ago = timezone.now() - timedelta(seconds=120)
+        for attempt in (1, 2):
+            job = claim()
+            self.assertEqual(job.attempts, attempt)
+            # Обработчик упал, не записав результат.
+            Job.objects.filter(pk=job.pk).update(date_update=long_ago)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertIsNone(claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(job.error)
+
+    def test_shopping_list_job(self):
+        response = self.client.post(
+            '/api/recipes/shopping_cart_file/', {'file_format': 'csv'},
+            format='json')
+        self.assertEqual(response.status_code, 202)
+        url = f'/api/jobs/{response.json()["id"]}/'
+        self.assertEqual(self.client.get(url).json()['status'], Job.PENDING)
+
+        self.run_jobs()
+        job = self.client.get(url).json()
+        self.assertEqual(job['status'], Job.DONE)
+        self.assertEqual(job['file'], f'http://testserver{url}file/')
+        self.assertFalse(os.listdir(MEDIA_ROOT))
+        response = self.client.get(job['file'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('shopping_list.csv', response['Content-Disposition'])
+        self.assertIn('соль,7,г', b''.join(
+            response.streaming_content).decode())
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(job['file']).status_code, 404)
+
+    @override_settings(JOB_RESULT_TTL=60)
+    def test_expired_jobs_are_cleaned(self):
+        job = enqueue('shopping_list', {
+            'user_id': self.user.id, 'file_format': 'txt'}, user=self.user)
+        self.run_jobs()
+        job.refresh_from_db()
+        path = job.result['file']
+        self.assertTrue(private_storage().exists(path))
+        fresh = enqueue('test_flaky', {'fail_times': 0})
+        self.assertEqual(clean_expired(), 0)
+
+        Job.objects.filter(pk=job.pk).update(
+            date_update=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(clean_expired(), 1)
+        self.assertFalse(private_storage().exists(path))
+        self.assertEqual(list(Job.objects.all()), [fresh])
+
+    def test_shopping_list_job_validates_format(self):
+        response = self.client.post(
+            '/api/recipes/shopping_cart_file/', {'file_format': 'doc'},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,99 @@
+"""Рендерер и парсер json на orjson: совпадение с DRF и замер скорости.
+
+Замер сериализует страницу списка рецептов обоими рендерерами и
+выводит время и размер ответа в конце прогона.
+"""
+import sys
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO
+from time import perf_counter
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, TestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from api.views import RecipeViewSet
+from .fixtures import seed_dataset
+
+BENCH_PAGE = 100
+BENCH_REPEAT = 20
+
+
+class FastJSONTest(SimpleTestCase):
+    """Совпадение вывода с JSONRenderer и разбор запросов."""
+
+    def test_output_matches_drf(self):
+        data = OrderedDict([
+            ('created', datetime(2023, 9, 30, 21, 37, 1, 123456,
+                                 tzinfo=timezone.utc)),
+            ('local', datetime(2023, 9, 30, 21, 37)),
+            ('day', date(2023, 9, 30)),
+            ('duration', timedelta(minutes=90)),
+            ('price', Decimal('10.50')),
+            ('title', gettext_lazy('Рецепт')),
+            ('id', uuid.UUID(int=1)),
+            ('counts', {1: 'один', 2: None}),
+            ('text', 'строка с разделителем'),
+            ('items', [1, 2.5, True, ('кортеж',)]),
+        ])
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent_falls_back_to_drf(self):
+        data = {'name': 'соль'}
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_parser(self):
+        parser = FastJSONParser()
+        self.assertEqual(
+            parser.parse(BytesIO('{"name": "соль"}'.encode())),
+            {'name': 'соль'})
+        self.assertEqual(
+            parser.parse(BytesIO('{"name": "соль"}'.encode('cp1251')),
+                         parser_context={'encoding': 'cp1251'}),
+            {'name': 'соль'})
+        for body in (b'{"name": ', b'NaN', b'\xff'):
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+
+class FastJSONBenchmarkTest(TestCase):
+    """Сравнение скорости и размера ответа на странице рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=100, recipes=BENCH_PAGE)
+
+    def test_recipe_page(self):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = AnonymousUser()
+        view = RecipeViewSet(request=request, format_kwarg=None)
+        recipes = view.get_queryset()[:BENCH_PAGE]
+        data = RecipeSerializer(
+            recipes, many=True, context={'user': request.user}).data
+
+        results = {}
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            started = perf_counter()
+            for _ in range(BENCH_REPEAT):
+                body = renderer.render(data)
+            results[type(renderer).__name__] = (
+                len(body), (perf_counter() - started) * 1000 / BENCH_REPEAT)
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+        sys.stderr.write(f'\n{"renderer":<20} {"bytes":>10} {"ms":>10}\n')
+        for name, (size, ms) in results.items():
+            sys.stderr.write(f'{name:<20} {size:>10} {ms:>10.2f}\n')
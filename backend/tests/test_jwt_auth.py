@@ -0,0 +1,159 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import (TokenObtainSerializer, check_settings,
+                                token_denylist)
+from recipes.models import Favorite, Recipe
+
+User = get_user_model()
+
+
+@override_settings(JWT_AUTH=True)
+class JWTAuthTest(TestCase):
+    """Вход по JWT без запроса к базе за пользователем и отзыв токенов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@foodgram.test', password='secret',
+            first_name='Повар', last_name='Поваров')
+        cls.admin = User.objects.create_user(
+            username='admin', email='admin@foodgram.test',
+            password='secret', role=User.ADMIN)
+        cls.recipe = Recipe.objects.create(
+            author=cls.admin, name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes/images/test.png')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, email='cook@foodgram.test', password='secret'):
+        response = self.client.post('/api/auth/jwt/create/', {
+            'email': email, 'password': password})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def bearer(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_permission_checks_without_user_query(self):
+        self.bearer(self.login()['access'])
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        # Вставка в избранное и поиск рецепта при промахе, без
+        # обращения к таблицам пользователей и токенов.
+        with self.assertNumQueries(2):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Favorite.objects.filter(
+            user=self.user, recipe=self.recipe).exists())
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/recipes/cache_stats/')
+        self.assertEqual(response.status_code, 403)
+
+        self.bearer(self.login('admin@foodgram.test')['access'])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/recipes/cache_stats/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_me_loads_user_once(self):
+        self.bearer(self.login()['access'])
+        # Поля пользователя одним запросом и проверка подписки.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Повар')
+
+    def test_refresh_and_logout(self):
+        tokens = self.login()
+        response = self.client.post(
+            '/api/auth/jwt/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.bearer(response.json()['access'])
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 200)
+
+        response = self.client.post(
+            '/api/auth/jwt/logout/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 401)
+        self.client.credentials()
+        response = self.client.post(
+            '/api/auth/jwt/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_checks_token_owner(self):
+        admin_tokens = self.login('admin@foodgram.test')
+        self.bearer(self.login()['access'])
+        response = self.client.post(
+            '/api/auth/jwt/logout/', {'refresh': admin_tokens['refresh']})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/auth/jwt/logout/', {'refresh': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_password_change_revokes_tokens(self):
+        tokens = self.login()
+        self.bearer(tokens['access'])
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'secret', 'new_password': 'changed'})
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assertTrue(token_denylist.is_revoked(
+            AccessToken(tokens['access'])))
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 401)
+
+    def test_token_issued_right_after_revocation(self):
+        old = TokenObtainSerializer.get_token(self.user)
+        token_denylist.revoke_user(self.user.pk)
+        self.assertTrue(token_denylist.is_revoked(old))
+        self.assertTrue(token_denylist.is_revoked(old.access_token))
+        new = TokenObtainSerializer.get_token(self.user)
+        self.assertFalse(token_denylist.is_revoked(new))
+        self.assertFalse(token_denylist.is_revoked(new.access_token))
+
+    def test_role_change_revokes_tokens(self):
+        self.bearer(self.login()['access'])
+        self.user.role = User.ADMIN
+        self.user.save()
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 401)
+
+    def test_last_login_does_not_revoke_tokens(self):
+        self.bearer(self.login()['access'])
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, 200)
+
+    def test_disabled(self):
+        self.bearer(self.login()['access'])
+        with self.settings(JWT_AUTH=False):
+            response = self.client.post('/api/auth/jwt/create/', {
+                'email': 'cook@foodgram.test', 'password': 'secret'})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(
+                self.client.get('/api/users/me/').status_code, 401)
+
+
+class JWTSettingsTest(SimpleTestCase):
+    """JWT не запускается с кэшем, который не общий для процессов."""
+
+    def test_local_cache_is_rejected(self):
+        locmem = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(JWT_AUTH=True, CACHES=locmem):
+            with self.assertRaises(ImproperlyConfigured):
+                check_settings()
+        with self.settings(JWT_AUTH=False, CACHES=locmem):
+            check_settings()
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache'}}
+        with self.settings(JWT_AUTH=True, CACHES=shared):
+            check_settings()
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from api.management.commands.load_test import (
+    LoadTest, Stats, parse_mix, percentile)
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0,
+                   RECIPE_IMAGE_QUEUE='threads')
+class LoadTestCommandTest(TestCase):
+    """Нагрузочный тест через тестовый клиент в одном потоке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(5)])
+        author = User.objects.create(
+            username='author', email='author@foodgram.test')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes/images/test.png')
+        recipe.tags.add(tag)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'load.json')
+            stdout = StringIO()
+            call_command(
+                'load_test', '--concurrency', '1', '--iterations', '40',
+                '--users', '2', '--output', output, '--mix',
+                'browse=1,browse_user=1,toggle=1,create=1,download=1',
+                stdout=stdout)
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertIn('rps', stdout.getvalue())
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['concurrency'], 1)
+        endpoints = report['endpoints']
+        for endpoint in ('GET /api/recipes/', 'GET /api/recipes/ (user)',
+                         'POST /api/recipes/<id>/favorite/',
+                         'POST /api/recipes/',
+                         'GET /api/recipes/download_shopping_cart/'):
+            self.assertIn(endpoint, endpoints)
+        created = endpoints['POST /api/recipes/']
+        self.assertEqual(created['statuses'], {'201': created['requests']})
+        self.assertLessEqual(created['p50_ms'], created['p99_ms'])
+        self.assertEqual(Recipe.objects.count(), 1 + created['requests'])
+        self.assertEqual(report['requests'], sum(
+            item['requests'] for item in endpoints.values()))
+
+    def test_cleanup(self):
+        stdout = StringIO()
+        call_command(
+            'load_test', '--concurrency', '1', '--iterations', '10',
+            '--users', '2', '--mix', 'create=1', '--cleanup', stdout=stdout)
+        self.assertIn('Удалено пользователей 2, рецептов 10',
+                      stdout.getvalue())
+        self.assertFalse(
+            User.objects.filter(username__startswith='load-').exists())
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_transport_errors_are_logged_once_per_endpoint(self):
+        class BrokenTransport:
+            def request(self, method, path, token=None, data=None):
+                raise ConnectionError('connection refused')
+
+        stats = Stats()
+        load = LoadTest(BrokenTransport(), stats, 1, 0)
+        with self.assertLogs('api.management.commands.load_test',
+                             'ERROR') as logs:
+            for _ in range(3):
+                load.call('GET /api/tags/', 'GET', '/api/tags/')
+            load.call('GET /api/ingredients/', 'GET', '/api/ingredients/')
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('connection refused', logs.output[0])
+        self.assertEqual(stats.report(1)['errors'], 4)
+
+    def test_mix_and_percentiles(self):
+        self.assertEqual(parse_mix('browse=3, toggle=1'),
+                         {'browse': 3, 'toggle': 1})
+        for value in ('unknown=1', 'browse=x', 'browse=0'):
+            with self.assertRaises(CommandError):
+                parse_mix(value)
+        values = list(range(1, 101))
+        self.assertEqual(
+            [percentile(values, percent) for percent in (50, 95, 99)],
+            [50, 95, 99])
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
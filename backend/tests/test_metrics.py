@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock, skipIf
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+try:
+    from prometheus_client.parser import text_string_to_metric_families
+except ImportError:
+    text_string_to_metric_families = None
+
+from api import metrics
+from jobs.queue import enqueue
+from recipes.models import Tag
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+WORKER = '''
+import django
+django.setup()
+from api.metrics import IMAGE_QUEUE, REQUESTS
+REQUESTS.labels('api:recipes-list', 'GET', 200).inc()
+IMAGE_QUEUE.inc()
+'''
+
+
+@skipIf(metrics.prometheus_client is None, 'prometheus_client не установлен')
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+    """Метрики Prometheus на /metrics."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#E26C2D')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return {
+            (sample.name, frozenset(sample.labels.items())): sample.value
+            for family in text_string_to_metric_families(
+                response.content.decode())
+            for sample in family.samples
+        }
+
+    def sample(self, samples, metric, **labels):
+        return samples.get((metric, frozenset(labels.items())))
+
+    def test_request_and_database_metrics(self):
+        tags_ok = {
+            'view': 'api:tags-list', 'method': 'GET', 'status': '200'}
+        before = self.sample(self.scrape(), 'foodgram_requests_total',
+                             **tags_ok) or 0
+        for _ in range(2):
+            self.client.get('/api/tags/')
+        self.client.get('/api/recipes/0/')
+        samples = self.scrape()
+        self.assertEqual(self.sample(
+            samples, 'foodgram_requests_total', **tags_ok), before + 2)
+        self.assertGreaterEqual(self.sample(
+            samples, 'foodgram_requests_total', view='api:recipes-detail',
+            method='GET', status='404'), 1)
+        self.assertGreaterEqual(self.sample(
+            samples, 'foodgram_request_duration_seconds_count',
+            view='api:tags-list', method='GET'), 2)
+        self.assertIsNotNone(self.sample(
+            samples, 'foodgram_db_queries_per_request_bucket',
+            view='api:tags-list', le='1.0'))
+        self.assertIsNotNone(self.sample(
+            samples, 'foodgram_db_duration_seconds_sum',
+            view='api:tags-list'))
+        self.assertFalse(any(dict(labels).get('view') == 'metrics'
+                             for _, labels in samples))
+
+    def test_cache_and_queue_metrics(self):
+        before = metrics.cache_stats('tags')
+        self.client.get('/api/tags/')
+        self.client.get('/api/tags/')
+        enqueue('process_recipe_image', {'recipe_id': 1, 'image_name': 'x'})
+        samples = self.scrape()
+        self.assertEqual(self.sample(
+            samples, 'foodgram_cache_hits_total', cache='tags'),
+            before['hits'] + 1)
+        self.assertEqual(self.sample(
+            samples, 'foodgram_cache_misses_total', cache='tags'),
+            before['misses'] + 1)
+        self.assertEqual(self.sample(
+            samples, 'foodgram_jobs_pending', name='process_recipe_image'), 1)
+        self.assertIsNotNone(self.sample(
+            samples, 'foodgram_image_queue_pending'))
+
+    def test_workers_are_aggregated(self):
+        with tempfile.TemporaryDirectory() as root:
+            # Каталога еще нет, как у manage.py, запущенного не через
+            # gunicorn.
+            path = os.path.join(root, 'prometheus')
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path,
+                       DJANGO_SETTINGS_MODULE='foodgram_backend.settings')
+            pids = []
+            for _ in range(2):
+                worker = subprocess.Popen(
+                    [sys.executable, '-c', WORKER], env=env, cwd=BASE_DIR)
+                self.assertEqual(worker.wait(), 0)
+                pids.append(worker.pid)
+            # Как child_exit в gunicorn.conf.py для завершенного воркера.
+            metrics.multiprocess.mark_process_dead(pids[0], path)
+            with mock.patch.object(metrics, 'MULTIPROC_DIR', path):
+                samples = self.scrape()
+        self.assertEqual(self.sample(
+            samples, 'foodgram_requests_total', view='api:recipes-list',
+            method='GET', status='200'), 2)
+        self.assertEqual(self.sample(
+            samples, 'foodgram_image_queue_pending'), 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
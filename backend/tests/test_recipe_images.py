@@ -0,0 +1,133 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.images import image_pool, process_recipe_image, variants_dir
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data(width=1200, height=800):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), '#E26C2D').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class RecipeImageTest(TestCase):
+    """Обработка картинок рецептов вне запроса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.test')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, image):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'tags': [self.tag.id],
+            'image': image,
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+        }, format='json')
+
+    def test_original_is_used_until_variants_are_ready(self):
+        response = self.create(image_data())
+        self.assertEqual(response.status_code, 201)
+        recipe = response.json()
+        self.assertEqual(set(recipe['image_variants']), {
+            'thumbnail', 'thumbnail_webp', 'medium', 'medium_webp'})
+        self.assertTrue(all(url == recipe['image']
+                            for url in recipe['image_variants'].values()))
+
+    def test_variants_are_created_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create(image_data())
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(len(recipe.image_variants), 4)
+        with default_storage.open(recipe.image_variants['thumbnail']) as f:
+            self.assertEqual(max(Image.open(f).size), 320)
+        with default_storage.open(
+                recipe.image_variants['medium_webp']) as file:
+            self.assertEqual(Image.open(file).format, 'WEBP')
+        variants = self.client.get(
+            f'/api/recipes/{recipe.id}/').json()['image_variants']
+        self.assertTrue(variants['thumbnail_webp'].endswith(
+            variants_dir(recipe.id, recipe.image.name) + '/thumbnail.webp'))
+
+    def test_image_replacement_resets_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.create(image_data()).json()['id']
+        response = self.client.patch(f'/api/recipes/{recipe_id}/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'tags': [self.tag.id],
+            'image': image_data(100, 100),
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Recipe.objects.get(pk=recipe_id).image_variants, {})
+
+    def test_stale_job_keeps_new_variants(self):
+        recipe_id = self.create(image_data()).json()['id']
+        old_image = Recipe.objects.get(pk=recipe_id).image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/recipes/{recipe_id}/', {
+                'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+                'tags': [self.tag.id],
+                'image': image_data(100, 100),
+            }, format='json')
+        variants = Recipe.objects.get(pk=recipe_id).image_variants
+        self.assertEqual(len(variants), 4)
+
+        process_recipe_image(recipe_id, old_image)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).image_variants, variants)
+        self.assertTrue(all(default_storage.exists(path)
+                            for path in variants.values()))
+
+    @override_settings(RECIPE_IMAGE_RETRY_DELAY=0)
+    def test_pool_retries_failures(self):
+        with mock.patch('api.images.process_recipe_image',
+                        side_effect=[OSError, None]) as process, \
+                mock.patch('api.images.connection'), \
+                mock.patch('api.images.IMAGE_QUEUE'), \
+                mock.patch.object(image_pool, 'pending', 1), \
+                self.assertLogs('api.images', 'ERROR'):
+            image_pool._run(1, 'recipes/images/x.png')
+            self.assertEqual(image_pool.pending, 0)
+        self.assertEqual(process.call_count, 2)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024)
+    def test_size_cap(self):
+        response = self.create(image_data())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    def test_invalid_base64(self):
+        response = self.create('data:image/png;base64,не base64')
+        self.assertEqual(response.status_code, 400)
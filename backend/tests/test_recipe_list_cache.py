@@ -0,0 +1,139 @@
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api import metrics
+from api.cache import recipe_list_cache
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+User = get_user_model()
+
+
+class RecipeListCacheTest(TestCase):
+    """Кэш страниц списка рецептов для анонимных пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@foodgram.test')
+        cls.admin = User.objects.create(
+            username='admin', email='admin@foodgram.test', role=User.ADMIN)
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.older = Recipe.objects.create(
+            name='старый', text='текст', author=cls.author,
+            image='x.png', cooking_time=5)
+        cls.newer = Recipe.objects.create(
+            name='новый', text='текст', author=cls.author,
+            image='x.png', cooking_time=5)
+        cls.newer.tags.set([cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, max_queries=None):
+        if max_queries is None:
+            return self.client.get(url).json()
+        with self.assertNumQueries(max_queries):
+            return self.client.get(url).json()
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.get('/api/recipes/?limit=1&tags=breakfast')
+        second = self.get('/api/recipes/?tags=breakfast&limit=1', 0)
+        self.assertEqual(first, second)
+
+    def test_recipe_change_drops_only_its_pages(self):
+        self.get('/api/recipes/?limit=1&page=1')
+        self.get('/api/recipes/?limit=1&page=2')
+        self.older.name = 'обновленный'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.older.save()
+        self.get('/api/recipes/?limit=1&page=1', 0)
+        page = self.get('/api/recipes/?limit=1&page=2')
+        self.assertEqual(page['results'][0]['name'], 'обновленный')
+
+    def test_pages_are_dropped_after_commit(self):
+        """Страница, собранная до фиксации транзакции с новым рецептом,
+        не остается в кэше под версией, сброшенной этим рецептом."""
+        version = recipe_list_cache.version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.create(name='еще один', text='текст',
+                                  author=self.author, image='x.png',
+                                  cooking_time=5)
+            self.assertEqual(recipe_list_cache.version(), version)
+            # Параллельный запрос до фиксации видит старую версию.
+            self.get('/api/recipes/')
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(recipe_list_cache.version(), version)
+        self.assertEqual(self.get('/api/recipes/')['count'], 3)
+
+    def test_ingredient_change_drops_recipe_pages(self):
+        self.get('/api/recipes/?limit=1&page=2')
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientAmount.objects.create(
+                recipe=self.older, ingredient=self.ingredient, amount=5)
+        page = self.get('/api/recipes/?limit=1&page=2')
+        self.assertEqual(len(page['results'][0]['ingredients']), 1)
+
+    def test_new_recipe_drops_all_pages(self):
+        self.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(name='еще один', text='текст',
+                                  author=self.author, image='x.png',
+                                  cooking_time=5)
+        self.assertEqual(self.get('/api/recipes/')['count'], 3)
+
+    def test_tags_change_drops_filtered_pages(self):
+        self.assertEqual(self.get('/api/recipes/?tags=breakfast')['count'],
+                         1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.older.tags.add(self.tag)
+        self.assertEqual(self.get('/api/recipes/?tags=breakfast')['count'],
+                         2)
+
+    def test_only_author_fields_drop_pages(self):
+        self.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='new', email='new@foodgram.test')
+            self.author.set_password('новый пароль')
+            self.author.save()
+            self.author.last_login = self.author.date_joined
+            self.author.save(update_fields=['last_login'])
+        self.get('/api/recipes/', 0)
+
+        self.author.first_name = 'Гордон'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        page = self.get('/api/recipes/')
+        self.assertEqual(page['results'][0]['author']['first_name'],
+                         'Гордон')
+
+    def test_authenticated_and_other_params_are_not_cached(self):
+        before = recipe_list_cache.stats()
+        self.get('/api/recipes/?is_favorited=1')
+        self.get('/api/recipes/?is_favorited=1')
+        self.client.force_authenticate(self.author)
+        self.get('/api/recipes/')
+        self.get('/api/recipes/')
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.get('/api/recipes/cache_stats/'), before)
+
+    @skipIf(metrics.prometheus_client is None,
+            'prometheus_client не установлен')
+    def test_stats(self):
+        before = recipe_list_cache.stats()
+        self.get('/api/recipes/')
+        self.get('/api/recipes/')
+        self.assertEqual(
+            self.client.get('/api/recipes/cache_stats/').status_code, 401)
+        self.client.force_authenticate(self.admin)
+        stats = self.get('/api/recipes/cache_stats/')
+        self.assertEqual(stats['hits'], before['hits'] + 1)
+        self.assertEqual(stats['misses'], before['misses'] + 1)
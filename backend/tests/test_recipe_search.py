@@ -0,0 +1,62 @@
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import filters
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class RecipeSearchTest(TestCase):
+    """Поиск рецептов по названию и описанию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@foodgram.test')
+        cls.by_name = Recipe.objects.create(
+            name='борщ украинский', text='свекла и капуста',
+            author=author, image='x.png', cooking_time=60)
+        cls.by_text = Recipe.objects.create(
+            name='обед', text='борщ и хлеб',
+            author=author, image='x.png', cooking_time=10)
+        Recipe.objects.create(
+            name='омлет', text='яйца и молоко',
+            author=author, image='x.png', cooking_time=5)
+
+    def search(self, value):
+        response = APIClient().get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_name_matches_rank_above_text_matches(self):
+        self.assertEqual(self.search('борщ'),
+                         [self.by_name.id, self.by_text.id])
+
+    def test_empty_search_returns_all(self):
+        self.assertEqual(len(self.search('')), 3)
+
+    def test_no_matches(self):
+        self.assertEqual(self.search('пицца'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm есть в PostgreSQL')
+    @override_settings(RECIPE_SEARCH_TRIGRAM=True)
+    def test_search_without_pg_trgm(self):
+        with mock.patch.dict(filters._trigram_available, {'default': False}):
+            self.assertEqual(self.search('борщ'),
+                             [self.by_name.id, self.by_text.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm есть в PostgreSQL')
+    @override_settings(RECIPE_SEARCH_TRIGRAM=True)
+    def test_pg_trgm_is_checked_once(self):
+        with mock.patch.dict(filters._trigram_available, clear=True):
+            with self.assertNumQueries(1), \
+                    mock.patch.object(filters.logger, 'warning'):
+                installed = filters.trigram_available('default')
+            with self.assertNumQueries(0):
+                self.assertEqual(filters.trigram_available('default'),
+                                 installed)
@@ -0,0 +1,142 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from .fixtures import IMAGE, bulk_create
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def writes(context, table):
+    return [query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            and f'"{table}"' in query['sql'].split('(')[0]]
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0,
+                   RECIPE_IMAGE_QUEUE='threads')
+class RecipeUpdateTest(TestCase):
+    """Обновление рецепта записывает только изменения."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.test')
+        cls.tags = bulk_create(Tag, [
+            Tag(name=slug, slug=slug, color=color) for slug, color in (
+                ('breakfast', '#E26C2D'), ('lunch', '#49B64E'),
+                ('dinner', '#8775D2'))])
+        cls.ingredients = bulk_create(Ingredient, [
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(4)])
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/test.png')
+        cls.recipe.tags.set(cls.tags[:2])
+        bulk_create(IngredientAmount, [
+            IngredientAmount(recipe=cls.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in cls.ingredients[:3]])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return context
+
+    def amounts(self):
+        return dict(IngredientAmount.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'amount'))
+
+    def test_patch_touches_only_sent_fields(self):
+        context = self.patch({'name': 'Новое название'})
+        self.assertEqual(len(writes(context, 'recipes_ingredientamount')), 0)
+        self.assertEqual(len(writes(context, 'recipes_recipe_tags')), 0)
+        [update] = writes(context, 'recipes_recipe')
+        self.assertIn('"name"', update)
+        self.assertNotIn('"text"', update)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(len(self.amounts()), 3)
+
+    def test_unchanged_payload_writes_nothing(self):
+        context = self.patch({
+            'ingredients': [{'id': ingredient.id, 'amount': 10}
+                            for ingredient in self.ingredients[:3]],
+            'tags': [tag.id for tag in self.tags[:2]],
+            'name': 'Рецепт',
+            'cooking_time': 10,
+        })
+        for table in ('recipes_recipe', 'recipes_recipe_tags',
+                      'recipes_ingredientamount'):
+            self.assertEqual(writes(context, table), [], table)
+
+    def test_ingredients_and_tags_are_diffed(self):
+        kept = IngredientAmount.objects.get(
+            recipe=self.recipe, ingredient=self.ingredients[0])
+        context = self.patch({
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 10},
+                {'id': self.ingredients[1].id, 'amount': 25},
+                {'id': self.ingredients[3].id, 'amount': 5},
+            ],
+            'tags': [self.tags[1].id, self.tags[2].id],
+        })
+        self.assertEqual(len(writes(context, 'recipes_ingredientamount')), 3)
+        self.assertEqual(len(writes(context, 'recipes_recipe_tags')), 2)
+        self.assertEqual(writes(context, 'recipes_recipe'), [])
+        self.assertEqual(self.amounts(), {
+            self.ingredients[0].id: 10,
+            self.ingredients[1].id: 25,
+            self.ingredients[3].id: 5,
+        })
+        self.assertTrue(IngredientAmount.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(
+            set(self.recipe.tags.values_list('slug', flat=True)),
+            {'lunch', 'dinner'})
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_recipe_row_is_locked_before_ingredients_are_read(self):
+        context = self.patch({'ingredients': [
+            {'id': self.ingredients[0].id, 'amount': 15}]})
+        queries = [query['sql'] for query in context.captured_queries]
+        [lock] = [number for number, sql in enumerate(queries)
+                  if sql.endswith('FOR UPDATE')]
+        self.assertIn('"recipes_recipe"', queries[lock].split('WHERE')[0])
+        reads = [number for number, sql in enumerate(queries)
+                 if sql.startswith('SELECT')
+                 and '"recipes_ingredientamount"' in sql.split('WHERE')[0]]
+        self.assertLess(lock, reads[0])
+
+    def test_create_saves_recipe_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredients[0].id,
+                                 'amount': 10}],
+                'tags': [self.tags[0].id],
+                'image': IMAGE,
+                'name': 'Другой рецепт',
+                'text': 'Описание',
+                'cooking_time': 5,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        [insert] = writes(context, 'recipes_recipe')
+        self.assertTrue(insert.startswith('INSERT'))
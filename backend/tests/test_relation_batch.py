@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+from .fixtures import bulk_create
+
+User = get_user_model()
+
+
+class RelationBatchTest(TestCase):
+    """Пакетное добавление и удаление избранного, покупок и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.other = bulk_create(User, [
+            User(username=name, email=f'{name}@foodgram.test')
+            for name in ('cook', 'author', 'other')])
+        cls.recipes = bulk_create(Recipe, [
+            Recipe(author=cls.author, name=f'Рецепт {number}',
+                   text='Описание', cooking_time=5,
+                   image='recipes/images/test.png')
+            for number in range(3)])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, ids, queries=2):
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(
+                url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id']: item['status']
+                for item in response.json()['results']}
+
+    def test_shopping_cart(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        missing = 10 ** 6
+        url = '/api/recipes/shopping_cart/batch/'
+        self.assertEqual(
+            self.batch('post', url, [first, second, missing, second]),
+            {first: 'exists', second: 'created', missing: 'not_found'})
+        self.assertEqual(set(ShoppingCart.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True)),
+            {first, second})
+
+        self.assertEqual(self.batch('delete', url, [first, third]),
+                         {first: 'deleted', third: 'absent'})
+        self.assertEqual(list(ShoppingCart.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True)), [second])
+
+    def test_favorite(self):
+        ids = [recipe.id for recipe in self.recipes]
+        url = '/api/recipes/favorite/batch/'
+        self.assertEqual(set(self.batch('post', url, ids).values()),
+                         {'created'})
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(set(self.batch('delete', url, ids).values()),
+                         {'deleted'})
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_subscribe(self):
+        url = '/api/users/subscribe/batch/'
+        self.assertEqual(
+            self.batch('post', url, [self.author.id, self.user.id]),
+            {self.author.id: 'created', self.user.id: 'forbidden'})
+        self.assertEqual(list(Follow.objects.values_list(
+            'user_id', 'author_id')), [(self.user.id, self.author.id)])
+        self.assertEqual(
+            self.batch('delete', url, [self.author.id, self.other.id]),
+            {self.author.id: 'deleted', self.other.id: 'absent'})
+
+    @override_settings(RELATION_BATCH_MAX_SIZE=2)
+    def test_validation(self):
+        url = '/api/recipes/favorite/batch/'
+        for data in ({}, {'ids': []}, {'ids': ['x']}):
+            self.assertEqual(self.client.post(
+                url, data, format='json').status_code, 400)
+        self.assertEqual(self.client.post(
+            url, {'ids': [1]}).status_code, 200)
+        response = self.client.post(url, {'ids': [1, 2, 3]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.json())
+        # Повторы не считаются в лимит.
+        self.assertEqual(self.client.post(
+            url, {'ids': [1, 1, 2]}, format='json').status_code, 200)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post(
+            url, {'ids': [1]}, format='json').status_code, 401)
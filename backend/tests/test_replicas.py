@@ -0,0 +1,172 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.cache import tags_cache
+from api.catalog import ingredient_catalog
+from api.replicas import (PRIMARY_COOKIE, ReplicaLag, ReplicaMiddleware,
+                          read_from_primary, replica_lag)
+from api.search import ingredient_index
+from recipes.models import Ingredient, Tag
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'],
+                   REPLICA_MAX_LAG=5)
+class ReplicaRouterTest(SimpleTestCase):
+    """Выбор базы роутером внутри запроса, без обращения к базам."""
+
+    def setUp(self):
+        patcher = mock.patch.object(replica_lag, 'healthy', return_value=True)
+        self.healthy = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_request(self, method='get', write=False, cookies=None,
+                    action=None):
+        used = []
+
+        def view(request):
+            used.append(router.db_for_read(Tag))
+            if write:
+                router.db_for_write(Tag)
+                used.append(router.db_for_read(Tag))
+            if action is not None:
+                action(used)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/api/tags/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaMiddleware(view)(request), used
+
+    def test_safe_requests_read_from_one_replica(self):
+        response, used = self.run_request()
+        self.assertIn(used[0], settings.DATABASE_REPLICAS)
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_write_pins_to_primary(self):
+        response, used = self.run_request(write=True)
+        self.assertIn(used[0], settings.DATABASE_REPLICAS)
+        self.assertEqual(used[1], DEFAULT_DB_ALIAS)
+        cookie = response.cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        response, used = self.run_request(cookies={PRIMARY_COOKIE: '1'})
+        self.assertEqual(used, [DEFAULT_DB_ALIAS])
+
+    def test_unsafe_methods_use_primary(self):
+        response, used = self.run_request('post', write=True)
+        self.assertEqual(used, [DEFAULT_DB_ALIAS] * 2)
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_lagging_replicas_are_skipped(self):
+        self.healthy.side_effect = lambda alias: alias == 'replica_2'
+        self.assertEqual(self.run_request()[1], ['replica_2'])
+        self.healthy.side_effect = None
+        self.healthy.return_value = False
+        self.assertEqual(self.run_request()[1], [DEFAULT_DB_ALIAS])
+
+    def test_cached_data_is_read_from_primary(self):
+        def read(used):
+            with read_from_primary():
+                used.append(router.db_for_read(Tag))
+            used.append(router.db_for_read(Tag))
+
+        response, used = self.run_request(action=read)
+        self.assertEqual(used[1], DEFAULT_DB_ALIAS)
+        self.assertEqual(used[2], used[0])
+        self.assertIn(used[0], settings.DATABASE_REPLICAS)
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_caches_and_catalogs_are_built_from_primary(self):
+        def record(used):
+            return lambda *args: used.append(
+                router.db_for_read(Ingredient)) or []
+
+        def build(used):
+            tags_cache.get(
+                'replica-test', lambda: used.append(router.db_for_read(Tag)))
+            with mock.patch.object(Ingredient.objects, 'values',
+                                   side_effect=record(used)):
+                ingredient_catalog.objects(refresh=True)
+            with mock.patch.object(Ingredient.objects, 'values_list',
+                                   side_effect=record(used)):
+                ingredient_index.invalidate()
+                ingredient_index.search('соль', 1)
+
+        self.addCleanup(ingredient_index.invalidate)
+        with mock.patch('api.cache.cache') as cache_mock:
+            cache_mock.get.return_value = None
+            _, used = self.run_request(action=build)
+        self.assertIn(used[0], settings.DATABASE_REPLICAS)
+        self.assertEqual(used[1:], [DEFAULT_DB_ALIAS] * 3)
+
+    def test_outside_request(self):
+        self.assertEqual(router.db_for_read(Tag), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Tag), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate('replica_1', 'recipes'))
+
+    def test_lag_is_cached(self):
+        lag = ReplicaLag()
+        with mock.patch.object(lag, 'measure', return_value=2.0) as measure:
+            self.assertTrue(lag.healthy('replica_1'))
+            self.assertTrue(lag.healthy('replica_1'))
+            measure.return_value = 10.0
+            with mock.patch('api.replicas.monotonic', return_value=10 ** 9):
+                self.assertFalse(lag.healthy('replica_1'))
+        self.assertEqual(measure.call_count, 2)
+
+        with mock.patch.object(lag, 'measure', return_value=None):
+            self.assertFalse(lag.healthy('replica_2'))
+
+    def test_unreachable_replica(self):
+        connection = mock.MagicMock(vendor='postgresql')
+        connection.cursor.side_effect = DatabaseError
+        with mock.patch('api.replicas.connections',
+                        {'replica_1': connection}):
+            self.assertIsNone(ReplicaLag().measure('replica_1'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS,
+            'Нужна реплика: DB_REPLICAS=replica.sqlite3 или хост PostgreSQL')
+class ReplicaRequestsTest(TransactionTestCase):
+    """Запросы к API с репликой, указывающей в тестах на основную базу."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.replica = settings.DATABASE_REPLICAS[0]
+        patcher = mock.patch('api.replicas.choose_replica',
+                             return_value=self.replica)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.client = APIClient()
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#E26C2D')
+
+    def test_reads_go_to_replica_until_write(self):
+        with CaptureQueriesContext(connections[self.replica]) as queries:
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+        # Ответ справочника попадает в кэш и строится из основной базы.
+        with self.assertNumQueries(0, using=self.replica):
+            response = self.client.get('/api/tags/?name=Завтрак')
+        self.assertEqual(len(response.json()), 1)
+
+        with mock.patch('api.views.TagViewSet.list',
+                        side_effect=self.write_tag, autospec=True):
+            response = self.client.get('/api/tags/')
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        with self.assertNumQueries(0, using=self.replica):
+            self.client.get('/api/users/')
+
+    def write_tag(self, view, request, *args, **kwargs):
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        return HttpResponse()
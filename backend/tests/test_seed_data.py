@@ -0,0 +1,103 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import models
+from django.db.models import Count, Min
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.catalog import tag_catalog
+
+from recipes.models import (Favorite, Follow, Ingredient, IngredientAmount,
+                            Recipe, ShoppingCart, Tag)
+
+User = get_user_model()
+
+
+class SeedDataTest(TestCase):
+    """Генерация синтетических данных командой seed_data."""
+
+    def seed(self, seed=7):
+        stdout = StringIO()
+        call_command(
+            'seed_data', '--users', '40', '--recipes', '120',
+            '--batch-size', '50', '--power-users', '0.05',
+            '--seed', str(seed), stdout=stdout)
+        return stdout.getvalue()
+
+    def snapshot(self):
+        """Сгенерированные строки относительно первых id, чтобы
+        сравнивать запуски с разными значениями последовательностей."""
+        user = User.objects.aggregate(first=Min('pk'))['first']
+        recipe = Recipe.objects.aggregate(first=Min('pk'))['first']
+        return (
+            sorted((pk - recipe, author - user, name, cooking_time)
+                   for pk, author, name, cooking_time
+                   in Recipe.objects.values_list(
+                       'pk', 'author', 'name', 'cooking_time')),
+            sorted((pk - recipe, ingredient, amount)
+                   for pk, ingredient, amount
+                   in IngredientAmount.objects.values_list(
+                       'recipe', 'ingredient', 'amount')),
+            sorted((follower - user, author - user)
+                   for follower, author in Follow.objects.values_list(
+                       'user', 'author')),
+            sorted((follower - user, pk - recipe)
+                   for follower, pk in ShoppingCart.objects.values_list(
+                       'user', 'recipe')),
+        )
+
+    def test_seed(self):
+        output = self.seed()
+        self.assertIn('recipes_shoppingcart', output)
+        self.assertTrue(Ingredient.objects.exists())
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Recipe.objects.count(), 120)
+        self.assertTrue(Favorite.objects.exists())
+        self.assertFalse(Follow.objects.filter(
+            user_id=models.F('author_id')).exists())
+        recipe = Recipe.objects.order_by('pk').first()
+        self.assertTrue(recipe.tags.exists())
+        self.assertTrue(recipe.ingredients.exists())
+        self.assertEqual(recipe.date_create.year, 2023)
+
+        # Первый автор самый популярный, первые пользователи активные.
+        authors = list(Recipe.objects.values('author').annotate(
+            count=Count('pk')).order_by('-count').values_list(
+                'author', flat=True))
+        first_user = User.objects.order_by('pk').first()
+        self.assertEqual(authors[0], first_user.pk)
+        carts = ShoppingCart.objects.values('user').annotate(
+            count=Count('pk'))
+        power = sum(item['count'] for item in carts
+                    if item['user'] < first_user.pk + 2)
+        self.assertGreater(power, ShoppingCart.objects.count() / 10)
+
+        # Новые id после загрузки идут за сгенерированными.
+        user = User.objects.create(username='new', email='new@foodgram.test')
+        self.assertEqual(user.pk, first_user.pk + 40)
+
+    def test_new_tags_reset_tag_caches(self):
+        cache.clear()
+        tag_catalog.objects(refresh=True)
+        client = APIClient()
+        self.assertEqual(client.get('/api/tags/').json(), [])
+        self.assertEqual(tag_catalog.objects(), {})
+        self.seed()
+        tags = set(Tag.objects.values_list('pk', flat=True))
+        self.assertEqual(
+            {tag['id'] for tag in client.get('/api/tags/').json()}, tags)
+        self.assertEqual(set(tag_catalog.objects()), tags)
+
+    def test_deterministic(self):
+        self.seed()
+        first = self.snapshot()
+        User.objects.all().delete()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        Recipe.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot(), first)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from api.profiling import ServerTimingMiddleware
+from recipes.models import Tag
+
+User = get_user_model()
+
+PROFILE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(SERVER_TIMING=True, PROFILE_DIR=PROFILE_DIR)
+class ServerTimingTest(TestCase):
+    """Заголовок Server-Timing и профилирование по запросу."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.user = (
+            User.objects.create(username=name, email=f'{name}@foodgram.test',
+                                role=role)
+            for name, role in (('admin', User.ADMIN), ('cook', User.USER)))
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#E26C2D')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+
+    def client_for(self, user):
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def metrics(self, response):
+        return {metric.split(';')[0]: metric
+                for metric in response['Server-Timing'].split(', ')}
+
+    def test_disabled_by_default(self):
+        with override_settings(SERVER_TIMING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ServerTimingMiddleware(lambda request: None)
+            response = APIClient().get('/api/tags/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_timings(self):
+        response = APIClient().get('/api/recipes/')
+        metrics = self.metrics(response)
+        self.assertEqual(
+            set(metrics), {'db', 'serialize', 'render', 'total'})
+        self.assertRegex(metrics['db'], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+
+        response = self.client_for(self.user).get('/api/users/me/')
+        self.assertIn('serialize', self.metrics(response))
+        self.assertNotIn('X-Profile-Dump', response)
+
+        response = self.client_for(self.admin).get('/api/users/')
+        self.assertIn('serialize', self.metrics(response))
+        # Замер подключается к отдельным сериализаторам, а не к DRF.
+        self.assertFalse(hasattr(BaseSerializer.data.fget, 'measured'))
+        self.assertEqual(BaseSerializer.data.fget.__module__,
+                         'rest_framework.serializers')
+
+    def test_profile_dumps_do_not_collide(self):
+        client = self.client_for(self.admin)
+        dumps = {client.get('/api/tags/', HTTP_X_PROFILE='1')[
+            'X-Profile-Dump'] for _ in range(3)}
+        self.assertEqual(len(dumps), 3)
+        self.assertTrue(all(str(os.getpid()) in dump for dump in dumps))
+
+    def test_admin_profile_dump(self):
+        response = self.client_for(self.admin).get(
+            '/api/tags/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        dump = os.path.join(PROFILE_DIR, response['X-Profile-Dump'])
+        with open(dump, encoding='utf-8') as file:
+            content = file.read()
+        self.assertIn('recipes_tag', content)
+        self.assertIn('cumulative', content)
+        self.assertTrue(os.path.exists(dump.replace('.txt', '.prof')))
+
+    def test_profile_requires_admin(self):
+        for client in (APIClient(), self.client_for(self.user)):
+            response = client.get('/api/tags/', {'profile': 1})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Dump', response)
+            self.assertIn('Server-Timing', response)
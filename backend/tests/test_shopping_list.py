@@ -0,0 +1,53 @@
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.renderers import (PDFShoppingListRenderer, ShoppingListRenderer,
+                           canvas)
+from recipes.models import Ingredient, IngredientAmount, Recipe, ShoppingCart
+
+User = get_user_model()
+
+
+class ShoppingListTest(TestCase):
+    """Скачивание списка покупок."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@foodgram.test')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes/images/test.png')
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredient=Ingredient.objects.create(
+                name='соль', measurement_unit='г'), amount=7)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_base_renderer_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingListRenderer()
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('соль,7,г', b''.join(
+            response.streaming_content).decode())
+
+    @skipIf(canvas is None, 'reportlab не установлен')
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_missing_pdf_font_fails_before_streaming(self):
+        with mock.patch.object(PDFShoppingListRenderer, 'font_name',
+                               'MissingShoppingListFont'), \
+                self.assertLogs('api.renderers', 'ERROR'):
+            response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.relations import insert_ignore
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+from .fixtures import bulk_create
+
+User = get_user_model()
+
+
+class ToggleTest(TestCase):
+    """Добавление и удаление избранного, покупок и подписок за два
+    запроса к базе без ошибок на повторах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = bulk_create(User, [
+            User(username=name, email=f'{name}@foodgram.test')
+            for name in ('cook', 'author')])
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes/images/test.png')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, method, url, status_code, queries=2):
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(url)
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response
+
+    def test_insert_ignore(self):
+        self.assertTrue(insert_ignore(
+            Favorite(user=self.user, recipe=self.recipe)))
+        self.assertFalse(insert_ignore(
+            Favorite(user=self.user, recipe=self.recipe)))
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_row_inserted_after_lookup_is_duplicate(self):
+        """Строка, которую другой запрос вставил между поиском рецепта
+        и вставкой, дает 400, а не второй 201."""
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        inserted = []
+
+        def concurrent_insert(execute, sql, params, many, context):
+            if sql.startswith('INSERT') and not inserted:
+                inserted.append(sql)
+                Favorite.objects.create(user=self.user, recipe=self.recipe)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_insert):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(len(inserted), 1)
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_recipe_toggles(self):
+        for model, action in ((Favorite, 'favorite'),
+                              (ShoppingCart, 'shopping_cart')):
+            url = f'/api/recipes/{self.recipe.id}/{action}/'
+            response = self.toggle('post', url, 201)
+            self.assertEqual(response.json()['name'], 'Рецепт')
+            self.assertIn('non_field_errors',
+                          self.toggle('post', url, 400).json())
+            self.assertEqual(model.objects.count(), 1)
+            self.toggle('delete', url, 204, queries=1)
+            self.toggle('delete', url, 400)
+            self.assertFalse(model.objects.exists())
+
+            url = f'/api/recipes/{10 ** 6}/{action}/'
+            self.toggle('post', url, 404, queries=1)
+            self.toggle('delete', url, 404)
+
+    def test_follow_toggle(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        response = self.toggle('post', url, 201, queries=3)
+        self.assertEqual(response.json()['recipes_count'], 1)
+        self.assertTrue(response.json()['is_subscribed'])
+        self.toggle('post', url, 400)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.toggle('delete', url, 204, queries=1)
+        self.toggle('delete', url, 400)
+
+        self.toggle('post', f'/api/users/{self.user.id}/subscribe/', 400,
+                    queries=1)
+        self.assertFalse(Follow.objects.exists())
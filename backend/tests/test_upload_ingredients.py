@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient
+
+
+class UploadIngredientsTest(TestCase):
+    """Загрузка справочника ингредиентов из файла."""
+
+    def write(self, suffix, content):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8', delete=False)
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def upload(self, *args):
+        stdout = StringIO()
+        call_command('upload_ingredients', *args, '--batch-size', '2',
+                     stdout=stdout)
+        return stdout.getvalue()
+
+    def ingredients(self):
+        return set(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+    def test_csv_is_normalised_and_rerun_is_safe(self):
+        path = self.write('.csv', (
+            'Абрикосовое  варенье , Г\n'
+            'абрикосовое варенье,г\n'
+            'соль,г\n'
+            'без единицы\n'
+            ',шт\n'))
+        output = self.upload(path)
+        self.assertEqual(self.ingredients(), {
+            ('абрикосовое варенье', 'г'), ('соль', 'г')})
+        self.assertIn('прочитано 3, добавлено 2, уже были 0, '
+                      'повторов в файле 1, пропущено некорректных 2', output)
+
+        output = self.upload(path)
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertIn('добавлено 0, уже были 2, повторов в файле 1', output)
+
+    def test_json(self):
+        items = [{'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+                 for number in range(5000)]
+        items.append({'name': 'Соль'})
+        path = self.write('.json', json.dumps(items, ensure_ascii=False))
+        Ingredient.objects.create(name='ингредиент 1', measurement_unit='г')
+        output = self.upload(path)
+        self.assertEqual(Ingredient.objects.count(), 5000)
+        self.assertIn('прочитано 5000, добавлено 4999, уже были 1, '
+                      'повторов в файле 0', output)
+        self.assertIn('пропущено некорректных 1', output)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY есть в PostgreSQL')
+    def test_copy(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write('.csv', (
+            'Соль,г\n'
+            'перец,г\n'
+            'Перец , Г\n'
+            'сахар,"кг, ""мешок"""\n'))
+        with CaptureQueriesContext(connection) as context:
+            output = self.upload(path)
+        self.assertTrue(any('FROM ingredient_import' in query['sql']
+                            for query in context.captured_queries))
+        self.assertEqual(self.ingredients(), {
+            ('соль', 'г'), ('перец', 'г'), ('сахар', 'кг, "мешок"')})
+        self.assertIn('прочитано 4, добавлено 2, уже были 1, '
+                      'повторов в файле 1, пропущено некорректных 0', output)
+
+    def test_bundled_catalog(self):
+        self.upload('ingredients.csv')
+        count = Ingredient.objects.count()
+        self.assertGreater(count, 2000)
+        self.upload('ingredients.csv')
+        self.assertEqual(Ingredient.objects.count(), count)
+
+    def test_errors(self):
+        with self.assertRaises(CommandError):
+            self.upload('missing.csv')
+        with self.assertRaises(CommandError):
+            self.upload(self.write('.json', '{"name": "соль"}'))
+        with self.assertRaises(CommandError):
+            self.upload(self.write('.json', '[{"name": "соль"'))